@@ -1,35 +1,189 @@
-from typing import Annotated
-from fastapi import Depends, HTTPException, status
+import hashlib
+import logging
+from typing import Annotated, List, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import REPLICA_KEY, AsyncSessionLocal, get_db, read_session
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.serialization import dumps_json
+from app.crud import todo as todo_crud
 from app.crud import user as user_crud
+from app.crud import version as version_crud
 from app.models.user import User
+from app.schemas.todo import Todo
 from app.schemas.token import TokenData
 
+logger = logging.getLogger(__name__)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+# Detached User instances keyed by id, kept for USER_CACHE_TTL_SECONDS. A
+# token whose "ver" claim differs from the cached token_version reloads the
+# user; a token matching a stale entry does not, so a token_version bumped in
+# the database only revokes older tokens here once the entry expires.
+user_cache = TTLCache(
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+)
+
+# Endpoints and the dependencies below share this one session per request.
+# scope="function" runs get_db's COMMIT when the endpoint returns rather than
+# after the response is sent, so a failed commit is an error response instead
+# of a 200 for a write that never landed.
+unit_of_work = Depends(get_db, scope="function")
+
+def invalidate_cached_user(user_id: int) -> None:
+    user_cache.delete(user_id)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_token_data(token: Annotated[str, Depends(oauth2_scheme)]) -> TokenData:
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = TokenData(email=email)
+        return TokenData(email=email, user_id=payload.get("uid"), version=payload.get("ver"))
     except JWTError as e:
-        print(f"JWT Error: {e}")
-        print(f"Token: {token}")
-        print(f"Secret Key used: {settings.SECRET_KEY[:5]}...")
+        # Never log the token itself.
+        logger.info("Rejected access token: %s", e)
         raise credentials_exception
-    user = user_crud.get_user_by_email(db, email=token_data.email)
-    if user is None:
+
+async def _resolve_user(db: AsyncSession, token_data: TokenData) -> User:
+    credentials_exception = _credentials_exception()
+    if token_data.user_id is None:
+        # Tokens issued before the "uid" claim existed; they expire within
+        # ACCESS_TOKEN_EXPIRE_MINUTES so this path is transitional.
+        user = await user_crud.get_user_by_email(db, email=token_data.email)
+        if user is None:
+            raise credentials_exception
+        return user
+
+    user = user_cache.get(token_data.user_id)
+    if user is None or user.token_version != token_data.version:
+        user = await user_crud.get_user(db, user_id=token_data.user_id)
+        if user is None:
+            invalidate_cached_user(token_data.user_id)
+            raise credentials_exception
+        db.expunge(user)
+        user_cache.set(user.id, user)
+    if user.token_version != token_data.version:
         raise credentials_exception
     return user
+
+async def get_current_user(token_data: TokenData = Depends(get_token_data), db: AsyncSession = unit_of_work):
+    return await _resolve_user(db, token_data)
+
+async def get_read_db(token_data: TokenData = Depends(get_token_data)):
+    async with read_session(token_data.user_id) as db:
+        yield db
+
+# For read-only endpoints: a replica session when replicas are configured
+# and the user has not written recently (see database.ReplicaSet).
+read_only = Depends(get_read_db, scope="function")
+
+async def get_current_reader(token_data: TokenData = Depends(get_token_data), db: AsyncSession = read_only):
+    """get_current_user for read-only endpoints, resolved on their read session."""
+    try:
+        return await _resolve_user(db, token_data)
+    except HTTPException:
+        if REPLICA_KEY not in db.info:
+            raise
+    # The replica may not have replayed a new signup yet; the primary decides.
+    async with AsyncSessionLocal() as primary:
+        return await _resolve_user(primary, token_data)
+
+async def get_collection_etag(
+    request: Request,
+    db: AsyncSession = read_only,
+    current_user: User = Depends(get_current_reader),
+) -> str:
+    """Strong ETag for a per-user list response.
+
+    Built from users.data_version, which every write to the user's todos,
+    subtasks and folders bumps, plus the query string, since each page or
+    filter is a different representation. Costs one primary-key lookup, on
+    the same read session as the body so the two always agree.
+    """
+    version = await version_crud.get_version(db, current_user.id)
+    query = "&".join(sorted(request.url.query.split("&")))
+    digest = hashlib.blake2b(f"{request.url.path}?{query}".encode(), digest_size=6).hexdigest()
+    return f'"{current_user.id}.{version}.{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so ignore any W/ prefix.
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+def etag_headers(etag: str) -> dict:
+    # no-cache: clients may store the body but must revalidate each time.
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def cached_json_response(body: bytes, etag: str, headers: Optional[dict] = None) -> Response:
+    """Return pre-serialized JSON (e.g. from the response cache) as-is."""
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={**(headers or {}), **etag_headers(etag)},
+    )
+
+def decode_id_cursor(after: Optional[str]) -> Optional[int]:
+    """The todo id in an X-Next-Cursor value, or a 400 for a bad cursor."""
+    if after is None:
+        return None
+    try:
+        (after_id,) = decode_cursor(after)
+        if not isinstance(after_id, int):
+            raise ValueError("Malformed cursor")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after_id
+
+def decode_position_cursor(after: Optional[str]) -> Optional[Tuple[str, int]]:
+    """The (position, id) key in a folder page's X-Next-Cursor, or a 400."""
+    if after is None:
+        return None
+    try:
+        after_position, after_id = decode_cursor(after)
+        if not isinstance(after_position, str) or not isinstance(after_id, int):
+            raise ValueError("Malformed cursor")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after_position, after_id
+
+todo_list_adapter = TypeAdapter(List[Todo])
+
+async def render_todo_page(db: AsyncSession, limit: int, **page) -> Tuple[bytes, dict]:
+    """One page of todos as a JSON body plus its X-Next-Cursor header.
+
+    `page` holds the remaining get_todos filters (user_id, after, ...).
+    """
+    folder_id = page.get("folder_id")
+    # Fetch one extra row to learn whether another page exists.
+    headers = {}
+    if settings.FAST_LIST_SERIALIZATION:
+        todos = await todo_crud.get_todo_rows(db, limit=limit + 1, **page)
+        if len(todos) > limit:
+            todos = todos[:limit]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(*todo_crud.page_key(todos[-1], folder_id))
+        return dumps_json(todos), headers
+    todos = await todo_crud.get_todos(db, limit=limit + 1, **page)
+    if len(todos) > limit:
+        todos = todos[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(*todo_crud.page_key(todos[-1], folder_id))
+    return todo_list_adapter.dump_json(todo_list_adapter.validate_python(todos, from_attributes=True)), headers
@@ -1,26 +1,89 @@
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
-from app.core.database import get_db
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.core.serialization import dumps_json
 from app.crud import folder as folder_crud
 from app.models.user import User
-from app.schemas.folder import Folder, FolderCreate
+from app.schemas.folder import Folder, FolderCreate, FolderSummaries
+from app.schemas.todo import Todo
 
 router = APIRouter(prefix="/folders", tags=["folders"])
 
+folder_list_adapter = TypeAdapter(List[Folder])
+
 @router.get("/", response_model=List[Folder])
-def read_folders(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(deps.get_current_user),
+async def read_folders(
+    request: Request,
+    etag: str = Depends(deps.get_collection_etag),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    if deps.etag_matches(request, etag):
+        return Response(status_code=304, headers=deps.etag_headers(etag))
+    cached = await response_cache.get(current_user.id, etag)
+    if cached is not None:
+        body, headers = cached
+        return deps.cached_json_response(body, etag, headers)
+    if settings.FAST_LIST_SERIALIZATION:
+        body = dumps_json(await folder_crud.get_folder_rows(db, user_id=current_user.id))
+    else:
+        folders = await folder_crud.get_folders(db, user_id=current_user.id)
+        body = folder_list_adapter.dump_json(folder_list_adapter.validate_python(folders, from_attributes=True))
+    await response_cache.set(current_user.id, etag, body)
+    return deps.cached_json_response(body, etag)
+
+@router.get("/summary", response_model=FolderSummaries)
+async def read_folder_summaries(
+    request: Request,
+    etag: str = Depends(deps.get_collection_etag),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    if deps.etag_matches(request, etag):
+        return Response(status_code=304, headers=deps.etag_headers(etag))
+    cached = await response_cache.get(current_user.id, etag)
+    if cached is not None:
+        body, headers = cached
+        return deps.cached_json_response(body, etag, headers)
+    folders, unfiled = await folder_crud.get_folder_summaries(db, user_id=current_user.id)
+    body = dumps_json({"folders": folders, "unfiled": unfiled})
+    await response_cache.set(current_user.id, etag, body)
+    return deps.cached_json_response(body, etag)
+
+@router.get("/{folder_id}/todos", response_model=List[Todo])
+async def read_folder_todos(
+    request: Request,
+    folder_id: int,
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+    etag: str = Depends(deps.get_collection_etag),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
 ):
-    return folder_crud.get_folders(db, user_id=current_user.id)
+    if deps.etag_matches(request, etag):
+        return Response(status_code=304, headers=deps.etag_headers(etag))
+    after_key = deps.decode_position_cursor(after)
+    cached = await response_cache.get(current_user.id, etag)
+    if cached is not None:
+        body, headers = cached
+        return deps.cached_json_response(body, etag, headers)
+    if await folder_crud.get_user_folder(db, folder_id=folder_id, user_id=current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    body, headers = await deps.render_todo_page(
+        db, limit=limit, user_id=current_user.id, after=after_key, folder_id=folder_id
+    )
+    await response_cache.set(current_user.id, etag, body, headers)
+    return deps.cached_json_response(body, etag, headers)
 
 @router.post("/", response_model=Folder)
-def create_folder(
+async def create_folder(
     folder: FolderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    return folder_crud.create_folder(db=db, folder=folder, user_id=current_user.id)
+    return await folder_crud.create_folder(db=db, folder=folder, user_id=current_user.id)
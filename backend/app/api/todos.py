@@ -1,110 +1,256 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import AsyncIterable, List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.sse import EventSourceResponse, ServerSentEvent
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import deps
-from app.core.database import get_db
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.events import change_broker
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.serialization import dumps_json
+from app.crud import batch as batch_crud
+from app.crud import position as position_crud
+from app.crud import search as search_crud
+from app.crud import subtask as subtask_crud
+from app.crud import sync as sync_crud
 from app.crud import todo as todo_crud
+from app.crud import transfer as transfer_crud
 from app.models.user import User
-from app.schemas.todo import Todo, TodoCreate, TodoUpdate
+from app.schemas.batch import BatchRequest, BatchResponse
+from app.schemas.subtask import SubTask, SubTaskCreate, SubTaskUpdate
+from app.schemas.sync import Changes
+from app.schemas.todo import Todo, TodoCreate, TodoMove, TodoSearchResult, TodoUpdate
+from app.schemas.transfer import ImportResult
 
 router = APIRouter(prefix="/todos", tags=["todos"])
 
 @router.post("/", response_model=Todo)
-def create_todo(
+async def create_todo(
     todo: TodoCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    return todo_crud.create_user_todo(db=db, todo=todo, user_id=current_user.id)
+    return await todo_crud.create_user_todo(db=db, todo=todo, user_id=current_user.id)
 
-@router.get("/", response_model=List[Todo])
-def read_todos(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+@router.post("/batch", response_model=BatchResponse)
+async def batch_todos(
+    batch: BatchRequest,
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    todos = todo_crud.get_todos(db, user_id=current_user.id, skip=skip, limit=limit)
-    return todos
+    results = await batch_crud.apply_batch(db, operations=batch.operations, user_id=current_user.id)
+    return {"results": results}
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_todos(current_user: User = Depends(deps.get_current_user)):
+    """All of the user's folders, todos and subtasks as NDJSON, streamed."""
+    return StreamingResponse(
+        transfer_crud.export_lines(current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="todos.ndjson"'},
+    )
+
+@router.post("/import", response_model=ImportResult)
+async def import_todos(request: Request, current_user: User = Depends(deps.get_current_user)):
+    """Load an NDJSON body in the export format, committing it in chunks.
+
+    The body is read as it arrives rather than parsed up front. On a bad
+    line the chunks before it stay imported; the 422 says how many.
+    """
+    try:
+        return await transfer_crud.import_lines(current_user.id, request.stream())
+    except transfer_crud.ImportFailed as e:
+        raise HTTPException(status_code=422, detail={"error": str(e), "imported": e.imported.model_dump()})
+
+@router.get("/changes", response_model=Changes)
+async def read_changes(
+    since: int = Query(0, ge=0, description="The version returned by the previous sync; 0 for a full download"),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    return await sync_crud.get_changes(db, user_id=current_user.id, since=since)
+
+@router.get("/search", response_model=List[TodoSearchResult])
+async def search_todos(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    after_key = None
+    if after is not None:
+        try:
+            after_rank, after_id = decode_cursor(after)
+            if not isinstance(after_rank, (int, float)) or not isinstance(after_id, int):
+                raise ValueError("Malformed cursor")
+            after_key = (after_rank, after_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows = await search_crud.search_todos(db, user_id=current_user.id, q=q, limit=limit + 1, after=after_key)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        todo, rank = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rank, todo.id)
+    return [{**Todo.model_validate(todo).model_dump(), "rank": rank} for todo, rank in rows]
+
+@router.get("/archive", response_model=List[Todo])
+async def read_archived_todos(
+    request: Request,
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+    etag: str = Depends(deps.get_collection_etag),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    """Archived todos, most recently created first."""
+    if deps.etag_matches(request, etag):
+        return Response(status_code=304, headers=deps.etag_headers(etag))
+    before_id = deps.decode_id_cursor(after)
+    cached = await response_cache.get(current_user.id, etag)
+    if cached is not None:
+        body, headers = cached
+        return deps.cached_json_response(body, etag, headers)
+    # Fetch one extra row to learn whether another page exists.
+    todos = await todo_crud.get_archived_todo_rows(db, user_id=current_user.id, limit=limit + 1, before_id=before_id)
+    headers = {}
+    if len(todos) > limit:
+        todos = todos[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(todos[-1]["id"])
+    body = dumps_json(todos)
+    await response_cache.set(current_user.id, etag, body, headers)
+    return deps.cached_json_response(body, etag, headers)
+
+@router.get("/stream", response_class=EventSourceResponse)
+async def stream_changes(
+    since: int = Query(0, ge=0, description="As for /todos/changes; the Last-Event-ID header takes precedence"),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    current_user: User = Depends(deps.get_current_user),
+) -> AsyncIterable[Changes]:
+    """Server-sent `changes` events, each shaped like GET /todos/changes.
+
+    The first event catches up from `since`; later ones follow each commit.
+    Event ids are versions, so a reconnecting EventSource resumes where it
+    left off.
+    """
+    user_id = current_user.id
+    cursor = last_event_id if last_event_id is not None else since
+    subscription = change_broker.subscribe(user_id)
+    first = True
+    try:
+        while True:
+            # The request's session (used to authenticate) closes before the
+            # stream starts; the stream holds a connection only per fetch.
+            async with AsyncSessionLocal() as fetch_db:
+                changes = await sync_crud.get_changes(fetch_db, user_id=user_id, since=cursor)
+            # Skip wake-ups for versions an earlier event already covered.
+            if first or changes["version"] != cursor:
+                first = False
+                cursor = changes["version"]
+                payload = Changes.model_validate(changes, from_attributes=True)
+                yield ServerSentEvent(event="changes", id=str(cursor), raw_data=payload.model_dump_json())
+            await subscription.wait()
+    finally:
+        change_broker.unsubscribe(subscription)
+
+@router.get("/", response_model=List[Todo])
+async def read_todos(
+    request: Request,
+    after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=500),
+    etag: str = Depends(deps.get_collection_etag),
+    db: AsyncSession = deps.read_only,
+    current_user: User = Depends(deps.get_current_reader),
+):
+    if deps.etag_matches(request, etag):
+        return Response(status_code=304, headers=deps.etag_headers(etag))
+    after_id = deps.decode_id_cursor(after)
+    cached = await response_cache.get(current_user.id, etag)
+    if cached is not None:
+        body, headers = cached
+        return deps.cached_json_response(body, etag, headers)
+    body, headers = await deps.render_todo_page(
+        db, limit=limit, user_id=current_user.id, skip=skip, after=after_id
+    )
+    await response_cache.set(current_user.id, etag, body, headers)
+    return deps.cached_json_response(body, etag, headers)
 
 @router.put("/{todo_id}", response_model=Todo)
-def update_todo(
+async def update_todo(
     todo_id: int,
     todo_update: TodoUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    todo = todo_crud.update_todo(db, todo_id=todo_id, todo_update=todo_update, user_id=current_user.id)
+    todo = await todo_crud.update_todo(db, todo_id=todo_id, todo_update=todo_update, user_id=current_user.id)
     if todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
     return todo
 
-@router.delete("/{todo_id}", response_model=Todo)
-def delete_todo(
+@router.patch("/{todo_id}/move", response_model=Todo)
+async def move_todo(
     todo_id: int,
-    db: Session = Depends(get_db),
+    move: TodoMove,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    todo = todo_crud.delete_todo(db, todo_id=todo_id, user_id=current_user.id)
+    if todo_id in (move.after_id, move.before_id):
+        raise HTTPException(status_code=400, detail="A todo cannot be placed next to itself")
+    try:
+        todo = await todo_crud.move_todo(
+            db, todo_id=todo_id, user_id=current_user.id, after_id=move.after_id, before_id=move.before_id
+        )
+    except ValueError as e:
+        # The client's view of the list is out of date; it should refetch.
+        raise HTTPException(status_code=409, detail=str(e))
     if todo is None:
         raise HTTPException(status_code=404, detail="Todo not found")
+    if len(todo.position) > settings.POSITION_REBALANCE_LENGTH:
+        background_tasks.add_task(position_crud.rebalance_folder, current_user.id, todo.folder_id)
     return todo
 
-from app.schemas.subtask import SubTask, SubTaskCreate
-from app.crud import subtask as subtask_crud
+@router.delete("/{todo_id}", response_model=Todo)
+async def delete_todo(
+    todo_id: int,
+    db: AsyncSession = deps.unit_of_work,
+    current_user: User = Depends(deps.get_current_user),
+):
+    todo = await todo_crud.delete_todo(db, todo_id=todo_id, user_id=current_user.id)
+    if todo is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    return todo
 
 @router.post("/{todo_id}/subtasks", response_model=SubTask)
-def create_subtask(
+async def create_subtask(
     todo_id: int,
     subtask: SubTaskCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    # Verify todo belongs to user
-    todo = todo_crud.get_todo(db, todo_id=todo_id)
-    if not todo or todo.user_id != current_user.id:
+    db_subtask = await subtask_crud.create_subtask(db=db, subtask=subtask, todo_id=todo_id, user_id=current_user.id)
+    if db_subtask is None:
         raise HTTPException(status_code=404, detail="Todo not found")
-    
-    return subtask_crud.create_subtask(db=db, subtask=subtask, todo_id=todo_id)
-
-
-from pydantic import BaseModel
-
-class SubTaskUpdate(BaseModel):
-    completed: bool
+    return db_subtask
 
 @router.put("/{todo_id}/subtasks/{subtask_id}", response_model=SubTask)
-def update_subtask(
+async def update_subtask(
     todo_id: int,
     subtask_id: int,
     subtask_update: SubTaskUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = deps.unit_of_work,
     current_user: User = Depends(deps.get_current_user),
 ):
-    # Verify todo belongs to user
-    todo = todo_crud.get_todo(db, todo_id=todo_id)
-    if not todo or todo.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Todo not found")
-    
-    # Verify subtask belongs to todo (optional but good practice)
-    # For now, relying on CRUD to find by ID, but strictly we should check relation.
-    # However, CRUD update_subtask just finds by ID.
-    # Let's trust the ID for now, or check if subtask.todo_id == todo_id if we fetched it.
-    
-    updated_subtask = subtask_crud.update_subtask(db, subtask_id=subtask_id, completed=subtask_update.completed)
+    # The crud call checks the subtask belongs to this user's todo and syncs
+    # the parent's completion status from its subtask counters.
+    updated_subtask = await subtask_crud.update_subtask(
+        db, todo_id=todo_id, subtask_id=subtask_id, completed=subtask_update.completed, user_id=current_user.id
+    )
     if not updated_subtask:
         raise HTTPException(status_code=404, detail="Subtask not found")
-    
-    # Sync parent todo completion status
-    # Refresh todo to ensure we have the latest subtasks state
-    db.refresh(todo)
-    
-    if todo.subtasks:
-        all_completed = all(sub.completed for sub in todo.subtasks)
-        if todo.completed != all_completed:
-            todo.completed = all_completed
-            db.add(todo)
-            db.commit()
-            
     return updated_subtask
@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+from app.core.config import settings
+
+class TTLCache:
+    """Bounded in-process cache with per-entry expiry and LRU eviction."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class MemoryCacheBackend:
+    """In-process LRU store bounded by total value size, indexed by user."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._owner: Dict[str, int] = {}
+        self._keys_by_user: Dict[int, Set[str]] = {}
+
+    async def get(self, user_id: int, key: str) -> Optional[bytes]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    async def set(self, user_id: int, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._discard(key)
+        self._data[key] = value
+        self._owner[key] = user_id
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self._discard(next(iter(self._data)))
+            self.evictions += 1
+
+    async def invalidate(self, user_id: int) -> None:
+        for key in list(self._keys_by_user.get(user_id, ())):
+            self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        value = self._data.pop(key, None)
+        if value is None:
+            return
+        self.size -= len(value)
+        user_id = self._owner.pop(key)
+        keys = self._keys_by_user[user_id]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_user[user_id]
+
+class RedisCacheBackend:
+    """Shared store for multi-worker deployments.
+
+    Works with any client exposing the redis.asyncio commands used here
+    (get, set, delete, sadd, smembers, expire). Size-bounded eviction is
+    left to the server's maxmemory-policy (e.g. allkeys-lru).
+    """
+
+    def __init__(self, client, ttl_seconds: int, prefix: str = "respcache"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def _user_index(self, user_id: int) -> str:
+        return f"{self.prefix}:{user_id}:keys"
+
+    async def get(self, user_id: int, key: str) -> Optional[bytes]:
+        return await self.client.get(f"{self.prefix}:{user_id}:{key}")
+
+    async def set(self, user_id: int, key: str, value: bytes) -> None:
+        name = f"{self.prefix}:{user_id}:{key}"
+        await self.client.set(name, value, ex=self.ttl_seconds)
+        await self.client.sadd(self._user_index(user_id), name)
+        await self.client.expire(self._user_index(user_id), self.ttl_seconds)
+
+    async def invalidate(self, user_id: int) -> None:
+        index = self._user_index(user_id)
+        names = await self.client.smembers(index)
+        await self.client.delete(index, *names)
+
+class FakeRedis:
+    """Minimal in-memory stand-in for redis.asyncio.Redis, for local runs and tests."""
+
+    def __init__(self):
+        self._values: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+
+    def _live(self, name: str) -> bool:
+        expires_at = self._expires.get(name)
+        if expires_at is not None and expires_at < time.monotonic():
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._values
+
+    async def get(self, name: str) -> Optional[bytes]:
+        return self._values[name] if self._live(name) else None
+
+    async def set(self, name: str, value: bytes, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        if nx and self._live(name):
+            return None
+        self._values[name] = value
+        self._expires.pop(name, None)
+        if ex is not None:
+            self._expires[name] = time.monotonic() + ex
+        return True
+
+    async def sadd(self, name: str, *members: str) -> None:
+        if not self._live(name):
+            self._values[name] = set()
+        self._values[name].update(members)
+
+    async def smembers(self, name: str) -> Set[str]:
+        return set(self._values[name]) if self._live(name) else set()
+
+    async def expire(self, name: str, seconds: int) -> None:
+        if self._live(name):
+            self._expires[name] = time.monotonic() + seconds
+
+    async def delete(self, *names: str) -> None:
+        for name in names:
+            self._values.pop(name, None)
+            self._expires.pop(name, None)
+
+class ResponseCache:
+    """Serialized list responses per user, keyed by their ETag.
+
+    The ETag embeds the user's data_version, so an entry can never be served
+    after a write commits; invalidate() just frees the superseded entries.
+    Values are stored as a JSON header line followed by the body bytes.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def get(self, user_id: int, key: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        if self.backend is None:
+            return None
+        value = await self.backend.get(user_id, key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        headers, _, body = value.partition(b"\n")
+        return body, json.loads(headers)
+
+    async def set(self, user_id: int, key: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        if self.backend is not None:
+            await self.backend.set(user_id, key, json.dumps(headers or {}).encode() + b"\n" + body)
+
+    async def invalidate(self, user_id: int) -> None:
+        if self.backend is not None:
+            await self.backend.invalidate(user_id)
+
+def build_response_cache(backend: str, max_bytes: int, ttl_seconds: int, redis_url: Optional[str] = None) -> ResponseCache:
+    if backend == "none":
+        return ResponseCache()
+    if backend == "memory":
+        return ResponseCache(MemoryCacheBackend(max_bytes=max_bytes))
+    if backend == "fakeredis":
+        return ResponseCache(RedisCacheBackend(FakeRedis(), ttl_seconds=ttl_seconds))
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package") from e
+        if not redis_url:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires REDIS_URL")
+        return ResponseCache(RedisCacheBackend(redis.from_url(redis_url), ttl_seconds=ttl_seconds))
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend}")
+
+response_cache = build_response_cache(
+    settings.RESPONSE_CACHE_BACKEND,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    redis_url=settings.REDIS_URL,
+)
@@ -1,19 +1,311 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 
+from app.core import metrics
+from app.core.cache import TTLCache
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# Async drivers for the sync URLs accepted in DATABASE_URL.
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend in ASYNC_DRIVERS and parsed.drivername != ASYNC_DRIVERS[backend]:
+        parsed = parsed.set(drivername=ASYNC_DRIVERS[backend])
+    return parsed.render_as_string(hide_password=False)
+
+class _TimedQueue(AsyncAdaptedQueue):
+    """The pool's queue of idle connections, timing each get.
+
+    Only this wait is a checkout's time queueing for the pool; opening a
+    new connection when the queue is empty is timed separately.
+    """
+
+    def get(self, block=True, timeout=None):
+        start = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            metrics.pool_checkout_wait.observe(time.perf_counter() - start)
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for an idle connection,
+    how long opening new ones takes, and how many checkouts gave up after
+    DB_POOL_TIMEOUT."""
+
+    _queue_class = _TimedQueue
+    timeouts = 0
+
+    def _do_get(self):
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            InstrumentedAsyncQueuePool.timeouts += 1
+            raise
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            metrics.pool_connect.observe(time.perf_counter() - start)
+
+def build_async_engine(url: str, pre_ping: bool = False):
+    """An async engine for `url` with the pool and connection DB_* settings."""
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": pre_ping or settings.DB_POOL_PRE_PING,
+    }
+    if make_url(url).get_backend_name() != "postgresql":
+        return create_async_engine(url, **options)
+    connect_args = {}
+    if settings.DB_PGBOUNCER:
+        # In transaction mode consecutive statements may run on different
+        # server connections, where a prepared statement does not exist.
+        # asyncpg still prepares each statement once, so give those unique
+        # names instead of reusing them.
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid.uuid4()}__",
+        )
+    elif settings.DB_STATEMENT_TIMEOUT_MS:
+        # A startup parameter, so it costs no round trip; PgBouncer rejects
+        # it, so behind one the timeout belongs on the database role.
+        connect_args["server_settings"] = {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}
+    return create_async_engine(url, connect_args=connect_args, **options)
+
+# Sync engine for scripts such as migrate.py; the API uses async_engine.
+# It keeps the library defaults: migrations build indexes that may
+# legitimately run longer than DB_STATEMENT_TIMEOUT_MS.
 engine = create_engine(
     settings.DATABASE_URL
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = build_async_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+metrics.instrument_engine(async_engine.sync_engine)
+# expire_on_commit=False keeps loaded attributes usable after commit, since
+# an expired attribute would need lazy IO during response serialization.
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+class ReplicaSet:
+    """Read replicas of the primary, chosen round-robin per read session.
+
+    Users who wrote within READ_YOUR_WRITES_SECONDS (see note_write) are
+    routed to the primary so they see their own changes despite replication
+    lag. A replica that fails is skipped until READ_REPLICA_RETRY_SECONDS
+    have passed, then tried again.
+    """
+
+    # Writers tracked for stickiness; the least recent are dropped first.
+    MAX_TRACKED_WRITERS = 100_000
+
+    def __init__(self, urls, sticky_seconds: float, retry_seconds: float):
+        # Pre-ping so a replica that went away is noticed at checkout, where
+        # the read can still fall back, rather than mid-query.
+        self.engines = [build_async_engine(async_database_url(url), pre_ping=True) for url in urls]
+        for replica in self.engines:
+            metrics.instrument_engine(replica.sync_engine)
+        self.sessionmakers = [
+            async_sessionmaker(replica, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+            for replica in self.engines
+        ]
+        self.retry_seconds = retry_seconds
+        self._down_until = [0.0] * len(self.engines)
+        self._next = 0
+        self._recent_writers = TTLCache(max_size=self.MAX_TRACKED_WRITERS, ttl_seconds=sticky_seconds)
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.fallback_reads = 0
+
+    @property
+    def healthy(self) -> int:
+        now = time.monotonic()
+        return sum(1 for until in self._down_until if until <= now)
+
+    def note_write(self, user_id: int) -> None:
+        if self.engines:
+            self._recent_writers.set(user_id, True)
+
+    def pick(self, user_id: Optional[int]) -> Optional[int]:
+        """Index of the replica to read from, or None for the primary."""
+        if not self.engines:
+            return None
+        if user_id is None:
+            # Legacy tokens without a "uid" claim; too rare to route.
+            return None
+        if self._recent_writers.get(user_id):
+            self.sticky_reads += 1
+            return None
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (index + 1) % len(self.engines)
+            if self._down_until[index] <= now:
+                return index
+        self.fallback_reads += 1
+        return None
+
+    def mark_down(self, index: int) -> None:
+        if self._down_until[index] <= time.monotonic():
+            logger.warning("Read replica %d is unavailable, using the primary for %ss", index, self.retry_seconds)
+        self._down_until[index] = time.monotonic() + self.retry_seconds
+
+    async def dispose(self) -> None:
+        for replica in self.engines:
+            await replica.dispose()
+
+replicas = ReplicaSet(
+    settings.READ_REPLICA_URLS,
+    sticky_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    retry_seconds=settings.READ_REPLICA_RETRY_SECONDS,
+)
+# Session.info key holding the replica index of a read session.
+REPLICA_KEY = "replica"
+
+metrics.registry.register(metrics.Gauge(
+    "db_replicas_healthy", "Read replicas currently in rotation.", lambda: replicas.healthy,
+))
+metrics.registry.register(metrics.Gauge(
+    "db_replica_reads_total", "Read sessions served by a replica.", lambda: replicas.replica_reads, kind="counter",
+))
+metrics.registry.register(metrics.Gauge(
+    "db_replica_sticky_reads_total", "Read sessions sent to the primary for read-your-writes.",
+    lambda: replicas.sticky_reads, kind="counter",
+))
+metrics.registry.register(metrics.Gauge(
+    "db_replica_fallback_reads_total", "Read sessions sent to the primary because no replica was usable.",
+    lambda: replicas.fallback_reads, kind="counter",
+))
+
+def pool_stats(target) -> dict:
+    """Connection counts of an async engine's pool, for GET /health/pool.
+
+    Every async engine is built by build_async_engine, so the overflow
+    limit is the configured one.
+    """
+    pool = target.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "timeout_seconds": pool.timeout(),
+    }
+
+metrics.registry.register(metrics.Gauge(
+    "db_pool_checked_out", "Primary pool connections currently in use.", lambda: async_engine.pool.checkedout(),
+))
+metrics.registry.register(metrics.Gauge(
+    "db_pool_idle", "Primary pool connections open and idle.", lambda: async_engine.pool.checkedin(),
+))
+metrics.registry.register(metrics.Gauge(
+    "db_pool_checkout_timeouts_total", "Checkouts from any pool that gave up after DB_POOL_TIMEOUT.",
+    lambda: InstrumentedAsyncQueuePool.timeouts, kind="counter",
+))
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# Session.info key set by discard_writes.
+DISCARD_KEY = "discard_writes"
+
+def discard_writes(db: AsyncSession) -> None:
+    """Have get_db roll the request back instead of committing it.
+
+    For crud functions whose write turned out to match nothing (a missing
+    row, an unchanged value) after bumping the user's data_version: the
+    unit of work, not the crud function, ends the transaction.
+    """
+    db.info[DISCARD_KEY] = True
+
+async def get_db():
+    """The request's unit of work.
+
+    Crud functions only flush; everything the request wrote commits here in
+    one COMMIT, or rolls back when the endpoint raises or a crud function
+    called discard_writes. Endpoints take it through deps.unit_of_work so
+    the commit finishes before the response is sent.
+    """
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+        if db.info.pop(DISCARD_KEY, False):
+            await db.rollback()
+        elif db.in_transaction():
+            await db.commit()
+
+async def open_read_session(user_id: Optional[int]) -> AsyncSession:
+    """A session for read-only work: on a replica when one is usable
+    (see ReplicaSet.pick), otherwise on the primary."""
+    index = replicas.pick(user_id)
+    while index is not None:
+        db = replicas.sessionmakers[index]()
+        try:
+            # Connect now so an unreachable replica costs a fallback, not
+            # the request.
+            await db.connection()
+        except (DBAPIError, OSError):
+            await db.close()
+            replicas.mark_down(index)
+            index = replicas.pick(user_id)
+            continue
+        db.info[REPLICA_KEY] = index
+        replicas.replica_reads += 1
+        return db
+    return AsyncSessionLocal()
+
+@asynccontextmanager
+async def read_session(user_id: Optional[int]):
+    """Read-only counterpart of get_db's session; nothing is committed."""
+    db = await open_read_session(user_id)
+    async with db:
+        try:
+            yield db
+        except DBAPIError as e:
+            # The replica went away mid-request; take it out of rotation.
+            if e.connection_invalidated and REPLICA_KEY in db.info:
+                replicas.mark_down(db.info[REPLICA_KEY])
+            raise
+
+async def _ping(target, connections: int):
+    async def ping():
+        async with target.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+async def warm_up(connections: int):
+    """Open pool connections ahead of the first requests.
+
+    The connections are held concurrently so the pool keeps that many open.
+    Replicas that cannot be reached are taken out of rotation.
+    """
+    await _ping(async_engine, connections)
+    for index, replica in enumerate(replicas.engines):
+        try:
+            await _ping(replica, connections)
+        except (DBAPIError, OSError):
+            replicas.mark_down(index)
@@ -0,0 +1,187 @@
+"""Per-user change notifications for the change stream.
+
+Writers announce "user U is now at data_version V" once their transaction
+commits. Each open stream holds a small bounded queue of those versions and
+answers a wake-up by sending everything after the last version it sent, so
+notifications can be coalesced or dropped without losing changes: a slow
+client's full queue drops its oldest entry instead of blocking writers or
+growing without bound.
+
+Fan-out is in-process ("memory") or, when several workers serve the same
+database, through Postgres LISTEN/NOTIFY ("postgres").
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Optional, Set
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import async_database_url, replicas
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "data_versions"
+# Session.info key for versions to publish once the session commits.
+PENDING_KEY = "pending_change_versions"
+
+class Subscription:
+    def __init__(self, user_id: int, max_pending: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[int]" = asyncio.Queue(maxsize=max_pending)
+
+    async def wait(self) -> int:
+        """Wait for a notification and return the newest pending version."""
+        version = await self.queue.get()
+        while not self.queue.empty():
+            version = max(version, self.queue.get_nowait())
+        return version
+
+class ChangeBroker:
+    """Routes published versions to the user's open streams.
+
+    Only touched from the event loop thread, so it needs no locking.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subs) for subs in self._subscriptions.values())
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.max_pending)
+        self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subs = self._subscriptions.get(subscription.user_id)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: int, version: int) -> None:
+        self.published += 1
+        for subscription in self._subscriptions.get(user_id, ()):
+            if subscription.queue.full():
+                subscription.queue.get_nowait()
+                self.dropped += 1
+            subscription.queue.put_nowait(version)
+
+    def resync(self) -> None:
+        """Wake every stream to re-check, after notifications may have been lost."""
+        for user_id in list(self._subscriptions):
+            self.publish(user_id, 0)
+
+class LocalChangeFeed:
+    """Publishes to this process's broker when the writing session commits."""
+
+    def __init__(self, broker: ChangeBroker):
+        self.broker = broker
+
+    async def stage(self, db: AsyncSession, user_id: int, version: int) -> None:
+        db.info.setdefault(PENDING_KEY, {})[user_id] = version
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+class PostgresChangeFeed:
+    """Publishes with NOTIFY, which Postgres delivers only on commit, and
+    relays every worker's notifications to the local broker via LISTEN."""
+
+    def __init__(self, broker: ChangeBroker, dsn: str):
+        self.broker = broker
+        self.dsn = dsn
+        self._task: Optional[asyncio.Task] = None
+
+    async def stage(self, db: AsyncSession, user_id: int, version: int) -> None:
+        await db.execute(select(func.pg_notify(NOTIFY_CHANNEL, f"{user_id}:{version}")))
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        user_id, version = payload.split(":")
+        # Other workers' writes start read-your-writes stickiness here too.
+        replicas.note_write(int(user_id))
+        self.broker.publish(int(user_id), int(version))
+
+    async def _listen(self):
+        import asyncpg
+
+        delay = 1
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                delay = 1
+                # Anything committed while we were not listening was missed.
+                self.broker.resync()
+                await lost.wait()
+                logger.warning("Lost the change feed LISTEN connection, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Change feed LISTEN failed, retrying in %ss", delay, exc_info=True)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        for user_id, version in pending.items():
+            change_broker.publish(user_id, version)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+def build_change_feed(backend: str, broker: ChangeBroker):
+    if backend == "memory":
+        return LocalChangeFeed(broker)
+    if backend == "postgres":
+        url = make_url(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+        return PostgresChangeFeed(broker, url.set(drivername="postgresql").render_as_string(hide_password=False))
+    raise ValueError(f"Unknown CHANGE_STREAM_BACKEND: {backend!r}")
+
+change_broker = ChangeBroker(settings.CHANGE_STREAM_QUEUE_SIZE)
+change_feed = build_change_feed(settings.CHANGE_STREAM_BACKEND, change_broker)
+
+metrics.registry.register(metrics.Gauge(
+    "change_stream_connections", "Open change streams in this process.", lambda: change_broker.connections,
+))
+metrics.registry.register(metrics.Gauge(
+    "change_stream_published_total", "Change notifications received by this process.",
+    lambda: change_broker.published, kind="counter",
+))
+metrics.registry.register(metrics.Gauge(
+    "change_stream_dropped_total", "Notifications dropped from full stream queues (coalesced, not lost).",
+    lambda: change_broker.dropped, kind="counter",
+))
@@ -0,0 +1,318 @@
+"""Idempotency-Key support for mutating requests.
+
+A client that may retry a POST/PUT/PATCH/DELETE sends the same
+Idempotency-Key header on every attempt. The first attempt runs and its
+response (anything below 500) is stored for IDEMPOTENCY_TTL_SECONDS;
+later attempts get the stored bytes back, marked Idempotent-Replayed,
+without the handler running again. An attempt that arrives while the first
+is still running waits for it, up to IDEMPOTENCY_WAIT_SECONDS, and
+replays its response; if it is still running after that, the retry gets
+a 409.
+
+Keys are scoped to the user and token version the access token names
+(the raw Authorization header when it names none), so clients cannot see
+each other's responses and a refreshed token still finds its retries.
+They are also tied to the request they were first used with: reusing one
+for a different method, path or body is a 422. The body is buffered for
+that check, so keyed bodies over IDEMPOTENCY_MAX_BODY_BYTES get a 413, and
+streamed uploads (STREAMING_PATHS) pass through without a key.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from jose import JWTError, jwt
+from app.core import metrics
+from app.core.cache import FakeRedis
+from app.core.config import settings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Endpoints that read their body as a stream; buffering it here would undo
+# that, so their Idempotency-Key is ignored.
+STREAMING_PATHS = {"/todos/import"}
+# How long a shared store's in-flight marker outlives a worker that died
+# mid-request, and how often waiting duplicates look for the result.
+IN_FLIGHT_SECONDS = 30
+POLL_SECONDS = 0.05
+
+class MemoryIdempotencyStore:
+    """Per-process store bounded by total size.
+
+    Every entry has the same TTL, so insertion order is expiry order: each
+    write first sweeps expired entries off the front, then evicts the
+    oldest until the new entry fits.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Event] = {}
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        while self._data:
+            key, (expires_at, value) = next(iter(self._data.items()))
+            if expires_at >= now:
+                break
+            self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        _, value = self._data.pop(key)
+        self.size -= len(value)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    async def begin(self, key: str) -> bool:
+        """Claim the key for one request; False if another holds it."""
+        if key in self._in_flight:
+            return False
+        self._in_flight[key] = asyncio.Event()
+        return True
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        """Wait for the key's in-flight request; False if it outlasts timeout."""
+        event = self._in_flight.get(key)
+        if event is None:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def finish(self, key: str, value: Optional[bytes]) -> None:
+        if value is not None and len(value) <= self.max_bytes:
+            self.sweep()
+            if key in self._data:
+                self._discard(key)
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._data)))
+        self._in_flight.pop(key).set()
+
+class RedisIdempotencyStore:
+    """Shared store, so a retry that reaches another worker still replays.
+
+    An in-flight request holds a SET NX marker; duplicates poll until the
+    response appears or the marker goes away.
+    """
+
+    def __init__(self, client, ttl_seconds: int, prefix: str = "idempotency"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"{self.prefix}:{key}")
+
+    async def begin(self, key: str) -> bool:
+        return bool(await self.client.set(f"{self.prefix}:{key}:lock", b"1", ex=IN_FLIGHT_SECONDS, nx=True))
+
+    async def wait(self, key: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while await self.client.get(f"{self.prefix}:{key}:lock") is not None:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(POLL_SECONDS)
+        return True
+
+    async def finish(self, key: str, value: Optional[bytes]) -> None:
+        if value is not None:
+            await self.client.set(f"{self.prefix}:{key}", value, ex=self.ttl_seconds)
+        await self.client.delete(f"{self.prefix}:{key}:lock")
+
+def build_idempotency_store(backend: str, max_bytes: int, ttl_seconds: int, redis_url: Optional[str] = None):
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return MemoryIdempotencyStore(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+    if backend == "fakeredis":
+        return RedisIdempotencyStore(FakeRedis(), ttl_seconds=ttl_seconds)
+    if backend == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("IDEMPOTENCY_BACKEND=redis requires the 'redis' package") from e
+        if not redis_url:
+            raise RuntimeError("IDEMPOTENCY_BACKEND=redis requires REDIS_URL")
+        return RedisIdempotencyStore(redis.from_url(redis_url), ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {backend}")
+
+def _encode(fingerprint: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> bytes:
+    # A JSON header line followed by the body, as in cache.ResponseCache.
+    head = {
+        "fingerprint": fingerprint,
+        "status": status,
+        "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+    }
+    return json.dumps(head).encode() + b"\n" + body
+
+def _decode(value: bytes):
+    head, _, body = value.partition(b"\n")
+    head = json.loads(head)
+    headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in head["headers"]]
+    return head["fingerprint"], head["status"], headers, body
+
+def _scope(authorization: bytes) -> bytes:
+    """Whose keys a request uses: the access token's user and token version.
+
+    Tokens without a "uid" claim, and invalid or expired ones (the request
+    gets a 401 anyway), fall back to the header itself.
+    """
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            claims = {}
+        if claims.get("uid") is not None:
+            return f"uid:{claims['uid']}:{claims.get('ver')}".encode()
+    return b"authorization:" + authorization
+
+def _key(authorization: bytes, client_key: bytes) -> str:
+    """Store key for a client's Idempotency-Key, scoped as in _scope."""
+    return hashlib.blake2b(_scope(authorization) + b"\0" + client_key, digest_size=16).hexdigest()
+
+async def _send_json(send, status: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class IdempotencyStats:
+    def __init__(self):
+        self.replays = 0
+        self.coalesced = 0
+
+class IdempotencyMiddleware:
+    """ASGI middleware applying Idempotency-Key to mutating requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        store = idempotency_store
+        if (
+            scope["type"] != "http" or scope["method"] not in MUTATING_METHODS
+            or scope["path"] in STREAMING_PATHS or store is None
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        client_key = headers.get(IDEMPOTENCY_HEADER.lower().encode())
+        if client_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        # The body is needed for the fingerprint, then handed to the app as is.
+        too_large = f"Requests with an {IDEMPOTENCY_HEADER} can have at most {settings.IDEMPOTENCY_MAX_BODY_BYTES} bytes"
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > settings.IDEMPOTENCY_MAX_BODY_BYTES:
+            await _send_json(send, 413, too_large)
+            return
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > settings.IDEMPOTENCY_MAX_BODY_BYTES:
+                await _send_json(send, 413, too_large)
+                return
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.blake2b(
+            b"\0".join((scope["method"].encode(), scope["path"].encode(), scope["query_string"], body)), digest_size=16
+        ).hexdigest()
+        key = _key(headers.get(b"authorization", b""), client_key)
+
+        while True:
+            stored = await store.get(key)
+            if stored is not None:
+                stored_fingerprint, status, stored_headers, stored_body = _decode(stored)
+                if stored_fingerprint != fingerprint:
+                    await _send_json(send, 422, f"{IDEMPOTENCY_HEADER} was already used for a different request")
+                    return
+                idempotency_stats.replays += 1
+                await send({
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": stored_headers + [(REPLAYED_HEADER.lower().encode(), b"true")],
+                })
+                await send({"type": "http.response.body", "body": stored_body})
+                return
+            if await store.begin(key):
+                break
+            # Another attempt with this key is running; replay its outcome,
+            # or run again if it produced nothing worth keeping.
+            idempotency_stats.coalesced += 1
+            if not await store.wait(key, settings.IDEMPOTENCY_WAIT_SECONDS):
+                await _send_json(send, 409, f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+                return
+
+        replayed_body = False
+
+        async def receive_body():
+            nonlocal replayed_body
+            if not replayed_body:
+                replayed_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def send_and_capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        value = None
+        try:
+            await self.app(scope, receive_body, send_and_capture)
+            # 5xx responses are not kept, so a retry can still succeed.
+            if response["status"] < 500:
+                value = _encode(fingerprint, response["status"], response["headers"], b"".join(response["body"]))
+        finally:
+            await store.finish(key, value)
+
+idempotency_stats = IdempotencyStats()
+idempotency_store = build_idempotency_store(
+    settings.IDEMPOTENCY_BACKEND,
+    max_bytes=settings.IDEMPOTENCY_MAX_BYTES,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    redis_url=settings.REDIS_URL,
+)
+
+metrics.registry.register(metrics.Gauge(
+    "idempotent_replays_total", "Responses replayed for a repeated Idempotency-Key.",
+    lambda: idempotency_stats.replays, kind="counter",
+))
+metrics.registry.register(metrics.Gauge(
+    "idempotent_coalesced_total", "Requests that waited for an in-flight request with the same Idempotency-Key.",
+    lambda: idempotency_stats.coalesced, kind="counter",
+))
@@ -0,0 +1,22 @@
+import base64
+import json
+from typing import Any
+
+# Keyset-paged list endpoints return the cursor for the next page in this
+# header so the response body can stay a plain JSON array.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*key: Any) -> str:
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """Return the key encoded by encode_cursor, or raise ValueError."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(key, list) or not key:
+        raise ValueError("Malformed cursor")
+    return key
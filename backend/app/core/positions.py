@@ -0,0 +1,129 @@
+"""Fractional position keys for user-ordered lists.
+
+A key is a string that sorts by plain byte comparison (Postgres columns
+holding keys use COLLATE "C"). A new key can always be made between any two
+keys, so moving an item rewrites only that item. Keys have an integer part
+whose first character gives its length ("a0".."az", then "b00".."bzz", ...),
+so appending to the end of a list grows keys only logarithmically, and an
+optional fraction for placing between neighbours, which grows by about one
+character per six insertions at the same spot; see crud/position for the
+rebalance that shortens them again.
+
+Based on the scheme used by Figma and rocicorp/fractional-indexing.
+"""
+from typing import Iterator, Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+ZERO = DIGITS[0]
+# Smallest integer part; nothing sorts before it without a fraction.
+SMALLEST_INTEGER = "A" + ZERO * 26
+FIRST_KEY = "a" + ZERO
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    # Fraction strictly between fractions a and b (None: 1), neither
+    # ending in ZERO.
+    if b is not None:
+        n = 0
+        while (a[n] if n < len(a) else ZERO) == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[:1]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid position key head {head!r}")
+
+def _split(key: str):
+    if not key:
+        raise ValueError("Empty position key")
+    integer = key[:_integer_length(key[0])]
+    fraction = key[len(integer):]
+    if len(integer) != _integer_length(key[0]) or key == SMALLEST_INTEGER or fraction.endswith(ZERO):
+        raise ValueError(f"Invalid position key {key!r}")
+    return integer, fraction
+
+def _increment(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) + 1
+        if d < len(DIGITS):
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = ZERO
+    if head == "Z":
+        return FIRST_KEY
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append(ZERO)
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def _decrement(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) - 1
+        if d >= 0:
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """A key sorting after a and before b; None means the start or end.
+
+    Raises ValueError unless a < b.
+    """
+    if a is None and b is None:
+        return FIRST_KEY
+    if a is None:
+        integer, fraction = _split(b)
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint("", fraction)
+        if fraction:
+            return integer
+        smaller = _decrement(integer)
+        if smaller is None:
+            raise ValueError("Cannot make a key before the smallest key")
+        return smaller
+    if b is None:
+        integer, fraction = _split(a)
+        larger = _increment(integer)
+        return integer + _midpoint(fraction, None) if larger is None else larger
+    if a >= b:
+        raise ValueError(f"Position keys out of order: {a!r} >= {b!r}")
+    integer_a, fraction_a = _split(a)
+    integer_b, fraction_b = _split(b)
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, fraction_b)
+    larger = _increment(integer_a)
+    if larger is not None and larger < b:
+        return larger
+    return integer_a + _midpoint(fraction_a, None)
+
+def keys_after(a: Optional[str]) -> Iterator[str]:
+    """Successive keys after a (or from the start), for appending in order."""
+    while True:
+        a = key_between(a, None)
+        yield a
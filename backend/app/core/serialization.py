@@ -0,0 +1,16 @@
+"""JSON encoding for pre-serialized responses (lists and the response cache).
+
+Uses orjson when installed and falls back to an equivalent compact stdlib
+encoding, so the output matches Pydantic's dump_json either way.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+def dumps_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
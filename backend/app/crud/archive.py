@@ -0,0 +1,177 @@
+"""Hot/cold split for todos.
+
+Completed todos that have gone untouched (updated_at) for
+ARCHIVE_COMPLETED_AFTER_DAYS move, with their subtasks, to the archive
+tables in batched background passes, so active lists only carry live rows.
+Editing an archived todo restores it first.
+
+Both directions are ordinary writes for the owner: they bump data_version,
+so cached lists, ETags and change streams follow. Archiving records a todo
+tombstone for sync; restoring removes it and re-stamps the todo and its
+subtasks so delta sync sends them again.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable, Optional, Set
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.crud.version import next_version, record_tombstones
+from app.models.archive import ArchivedSubTask, ArchivedTodo
+from app.models.subtask import SubTask
+from app.models.todo import Todo, utcnow
+from app.models.tombstone import Tombstone
+
+logger = logging.getLogger(__name__)
+
+TODO_FIELDS = (
+    "id", "title", "completed", "user_id", "folder_id",
+    "version", "total_subtasks", "completed_subtasks", "updated_at", "position",
+)
+SUBTASK_FIELDS = ("id", "title", "completed", "todo_id", "version")
+
+def _columns(model, fields, **overrides):
+    return [
+        literal(overrides[field]).label(field) if field in overrides else getattr(model, field)
+        for field in fields
+    ]
+
+async def archive_batch(db: AsyncSession, cutoff, batch_size: int) -> int:
+    """Archive up to batch_size todos completed and untouched since cutoff.
+
+    Owners' data_version rows are bumped before any todo is touched, the
+    same lock order as request writes, so a concurrent edit either lands
+    first (and the todo no longer qualifies) or waits and then finds it
+    archived and restores it.
+    """
+    completed_before = (Todo.completed == True, Todo.updated_at < cutoff)  # noqa: E712 - matches the partial index
+    candidates = (
+        await db.execute(
+            select(Todo.id, Todo.user_id).where(*completed_before).order_by(Todo.updated_at).limit(batch_size)
+        )
+    ).all()
+    if not candidates:
+        return 0
+    versions = {}
+    for user_id in sorted({row.user_id for row in candidates}):
+        versions[user_id] = await next_version(db, user_id)
+
+    # Re-check the condition: a candidate may have changed before we held
+    # its owner's row.
+    archived = (
+        await db.execute(
+            insert(ArchivedTodo)
+            .from_select(
+                TODO_FIELDS,
+                select(*_columns(Todo, TODO_FIELDS)).where(Todo.id.in_([row.id for row in candidates]), *completed_before),
+            )
+            .returning(ArchivedTodo.id, ArchivedTodo.user_id)
+        )
+    ).all()
+    todo_ids = [row.id for row in archived]
+    if todo_ids:
+        await db.execute(
+            insert(ArchivedSubTask).from_select(
+                SUBTASK_FIELDS, select(*_columns(SubTask, SUBTASK_FIELDS)).where(SubTask.todo_id.in_(todo_ids))
+            )
+        )
+        await db.execute(delete(SubTask).where(SubTask.todo_id.in_(todo_ids)).execution_options(synchronize_session=False))
+        await db.execute(delete(Todo).where(Todo.id.in_(todo_ids)).execution_options(synchronize_session=False))
+    for user_id, version in versions.items():
+        await record_tombstones(db, user_id, "todo", [row.id for row in archived if row.user_id == user_id], version)
+    return len(todo_ids)
+
+async def unarchive_todos(db: AsyncSession, todo_ids: Iterable[int], user_id: int, version: int) -> Set[int]:
+    """Move the user's archived todos among todo_ids back; returns their ids.
+
+    Restored rows carry `version` and a fresh updated_at, so they are sent
+    again by delta sync and not re-archived straight away.
+    """
+    todo_ids = list(todo_ids)
+    if not todo_ids:
+        return set()
+    restored = (
+        await db.scalars(
+            insert(Todo)
+            .from_select(
+                TODO_FIELDS,
+                select(*_columns(ArchivedTodo, TODO_FIELDS, version=version, updated_at=utcnow()))
+                .where(ArchivedTodo.id.in_(todo_ids), ArchivedTodo.user_id == user_id),
+            )
+            .returning(Todo.id)
+        )
+    ).all()
+    if not restored:
+        return set()
+    await db.execute(
+        insert(SubTask).from_select(
+            SUBTASK_FIELDS,
+            select(*_columns(ArchivedSubTask, SUBTASK_FIELDS, version=version)).where(ArchivedSubTask.todo_id.in_(restored)),
+        )
+    )
+    await db.execute(delete(ArchivedSubTask).where(ArchivedSubTask.todo_id.in_(restored)))
+    await db.execute(delete(ArchivedTodo).where(ArchivedTodo.id.in_(restored)))
+    await db.execute(
+        delete(Tombstone).where(Tombstone.user_id == user_id, Tombstone.entity == "todo", Tombstone.entity_id.in_(restored))
+    )
+    return set(restored)
+
+async def archive_completed(older_than_days: float, batch_size: int) -> int:
+    """One archive pass: batches, each its own transaction, until one comes up short."""
+    cutoff = utcnow() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            archived = await archive_batch(db, cutoff, batch_size)
+            await db.commit()
+        total += archived
+        archiver.archived += archived
+        if archived < batch_size:
+            return total
+        # Let request handlers in between batches.
+        await asyncio.sleep(0)
+
+class Archiver:
+    """Runs archive_completed every `interval` seconds in the background."""
+
+    def __init__(self, interval: float, older_than_days: float, batch_size: int):
+        self.interval = interval
+        self.older_than_days = older_than_days
+        self.batch_size = batch_size
+        self.archived = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                archived = await archive_completed(self.older_than_days, self.batch_size)
+                if archived:
+                    logger.info("Archived %d completed todos", archived)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Archive pass failed", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+archiver = Archiver(settings.ARCHIVE_INTERVAL_SECONDS, settings.ARCHIVE_COMPLETED_AFTER_DAYS, settings.ARCHIVE_BATCH_SIZE)
+
+metrics.registry.register(metrics.Gauge(
+    "todos_archived_total", "Completed todos moved to the archive by this process.",
+    lambda: archiver.archived, kind="counter",
+))
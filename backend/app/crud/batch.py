@@ -0,0 +1,183 @@
+from typing import Dict, List
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import discard_writes
+from app.core.positions import keys_after
+from app.crud.archive import unarchive_todos
+from app.crud.position import last_positions
+from app.crud.subtask import refresh_subtask_counters
+from app.crud.version import next_version, record_tombstones
+from app.models.folder import Folder
+from app.models.subtask import SubTask
+from app.models.todo import Todo
+from app.schemas.batch import BatchOperation, BatchResult
+
+async def _owned_todo_ids(db: AsyncSession, todo_ids: set, user_id: int) -> set:
+    if not todo_ids:
+        return set()
+    rows = await db.execute(select(Todo.id).where(Todo.id.in_(todo_ids), Todo.user_id == user_id))
+    return set(rows.scalars())
+
+async def _owned_folder_ids(db: AsyncSession, folder_ids: set, user_id: int) -> set:
+    if not folder_ids:
+        return set()
+    rows = await db.execute(select(Folder.id).where(Folder.id.in_(folder_ids), Folder.user_id == user_id))
+    return set(rows.scalars())
+
+async def _subtask_parents(db: AsyncSession, subtask_ids: set) -> Dict[int, int]:
+    if not subtask_ids:
+        return {}
+    rows = await db.execute(select(SubTask.id, SubTask.todo_id).where(SubTask.id.in_(subtask_ids)))
+    return dict(rows.all())
+
+async def apply_batch(db: AsyncSession, operations: List[BatchOperation], user_id: int) -> List[BatchResult]:
+    """Apply a mixed list of todo/subtask operations in a single transaction.
+
+    The user's version row is locked first, as for any write, so the
+    ownership queries that follow see no concurrent change from the same
+    user. Operations are then applied grouped by kind (creates, updates,
+    deletes) with one bulk statement per group. Operations that reference
+    a missing or foreign todo, subtask or folder are reported with status
+    404 and skipped; the rest are committed together.
+    """
+    results = [BatchResult(index=i, op=op.op, status=200) for i, op in enumerate(operations)]
+    version = await next_version(db, user_id)
+
+    referenced_todos = set()
+    referenced_subtasks = set()
+    referenced_folders = set()
+    for op in operations:
+        if op.op in ("update_todo", "delete_todo"):
+            referenced_todos.add(op.id)
+        elif op.op == "create_subtask" and op.todo_id is not None:
+            referenced_todos.add(op.todo_id)
+        elif op.op in ("update_subtask", "delete_subtask"):
+            referenced_todos.add(op.todo_id)
+            referenced_subtasks.add(op.id)
+        if op.op in ("create_todo", "update_todo") and op.todo.folder_id is not None:
+            referenced_folders.add(op.todo.folder_id)
+    owned_todos = await _owned_todo_ids(db, referenced_todos, user_id)
+    if referenced_todos - owned_todos:
+        # Operations on archived todos restore them first.
+        owned_todos |= await unarchive_todos(db, referenced_todos - owned_todos, user_id, version)
+    owned_folders = await _owned_folder_ids(db, referenced_folders, user_id)
+    subtask_parents = await _subtask_parents(db, referenced_subtasks)
+
+    def reject(i: int, status: int, detail: str):
+        results[i].status = status
+        results[i].detail = detail
+
+    todo_creates, subtask_creates = [], []
+    todo_updates, subtask_updates = [], []
+    todo_deletes, subtask_deletes = [], []
+    for i, op in enumerate(operations):
+        if op.op in ("create_todo", "update_todo") and op.todo.folder_id not in owned_folders | {None}:
+            reject(i, 404, "Folder not found")
+    for i, op in enumerate(operations):
+        if results[i].status != 200:
+            continue
+        if op.op == "create_todo":
+            todo_creates.append(i)
+        elif op.op == "create_subtask":
+            if op.todo_ref is not None:
+                if not (0 <= op.todo_ref < len(operations)) or operations[op.todo_ref].op != "create_todo":
+                    reject(i, 400, "todo_ref must point at a create_todo operation")
+                    continue
+                if results[op.todo_ref].status != 200:
+                    reject(i, 404, "Todo not found")
+                    continue
+            elif op.todo_id not in owned_todos:
+                reject(i, 404, "Todo not found")
+                continue
+            subtask_creates.append(i)
+        elif op.op in ("update_todo", "delete_todo"):
+            if op.id not in owned_todos:
+                reject(i, 404, "Todo not found")
+                continue
+            results[i].id = op.id
+            (todo_updates if op.op == "update_todo" else todo_deletes).append(i)
+        else:
+            if op.todo_id not in owned_todos:
+                reject(i, 404, "Todo not found")
+                continue
+            if subtask_parents.get(op.id) != op.todo_id:
+                reject(i, 404, "Subtask not found")
+                continue
+            results[i].id = op.id
+            (subtask_updates if op.op == "update_subtask" else subtask_deletes).append(i)
+
+    applied = todo_creates + subtask_creates + todo_updates + subtask_updates + todo_deletes + subtask_deletes
+    if not applied:
+        discard_writes(db)
+        return results
+
+    # New todos, and todos moved to another folder, go last in their folder,
+    # in operation order.
+    moved = [i for i in todo_updates if "folder_id" in operations[i].todo.model_fields_set]
+    current_folders = {}
+    if moved:
+        rows = await db.execute(select(Todo.id, Todo.folder_id).where(Todo.id.in_({operations[i].id for i in moved})))
+        current_folders = dict(rows.all())
+    moved = [i for i in moved if operations[i].todo.folder_id != current_folders.get(operations[i].id)]
+    target_folders = [operations[i].todo.folder_id for i in todo_creates + moved]
+    appended = {
+        folder_id: keys_after(last)
+        for folder_id, last in (await last_positions(db, user_id, target_folders)).items()
+    }
+    positions = {i: next(appended[operations[i].todo.folder_id]) for i in todo_creates + moved}
+
+    if todo_creates:
+        rows = [
+            dict(operations[i].todo.model_dump(), user_id=user_id, version=version, position=positions[i])
+            for i in todo_creates
+        ]
+        new_ids = (await db.scalars(insert(Todo).returning(Todo.id, sort_by_parameter_order=True), rows)).all()
+        for i, new_id in zip(todo_creates, new_ids):
+            results[i].id = new_id
+
+    # Todos whose subtask counters need recounting.
+    counted = {operations[i].todo_id for i in subtask_updates + subtask_deletes}
+    if subtask_creates:
+        rows = []
+        for i in subtask_creates:
+            op = operations[i]
+            todo_id = op.todo_id if op.todo_id is not None else results[op.todo_ref].id
+            counted.add(todo_id)
+            rows.append(dict(op.subtask.model_dump(), todo_id=todo_id, version=version))
+        new_ids = (await db.scalars(insert(SubTask).returning(SubTask.id, sort_by_parameter_order=True), rows)).all()
+        for i, new_id in zip(subtask_creates, new_ids):
+            results[i].id = new_id
+
+    rows = []
+    for i in todo_updates:
+        row = dict(operations[i].todo.model_dump(exclude_unset=True), id=operations[i].id, version=version)
+        if i in positions:
+            row["position"] = positions[i]
+        rows.append(row)
+    if rows:
+        await db.execute(
+            update(Todo).where(Todo.user_id == user_id).execution_options(synchronize_session=False), rows
+        )
+
+    if subtask_updates:
+        rows = [dict(operations[i].subtask.model_dump(), id=operations[i].id, version=version) for i in subtask_updates]
+        await db.execute(update(SubTask), rows)
+
+    if subtask_deletes:
+        ids = {operations[i].id for i in subtask_deletes}
+        await record_tombstones(db, user_id, "subtask", ids, version)
+        await db.execute(delete(SubTask).where(SubTask.id.in_(ids)).execution_options(synchronize_session=False))
+
+    deleted_todos = {operations[i].id for i in todo_deletes}
+    if deleted_todos:
+        await record_tombstones(db, user_id, "todo", deleted_todos, version)
+        # Subtasks cascade at the ORM level only, so remove them explicitly.
+        await db.execute(delete(SubTask).where(SubTask.todo_id.in_(deleted_todos)).execution_options(synchronize_session=False))
+        await db.execute(delete(Todo).where(Todo.id.in_(deleted_todos)).execution_options(synchronize_session=False))
+
+    # Counters are recounted once per touched todo rather than adjusted per
+    # operation; parent completion is re-derived only where subtasks were
+    # toggled or deleted.
+    synced = {operations[i].todo_id for i in subtask_updates + subtask_deletes} - deleted_todos
+    await refresh_subtask_counters(db, counted - deleted_todos, version, sync_completed_ids=synced)
+    return results
@@ -1,13 +1,95 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.crud.todo import IN_CHUNK_SIZE, attach_subtask_rows, todo_columns
+from app.crud.version import next_version
 from app.models.folder import Folder
+from app.models.todo import Todo
 from app.schemas.folder import FolderCreate
 
-def get_folders(db: Session, user_id: int):
-    return db.query(Folder).filter(Folder.user_id == user_id).all()
+def folder_load_options():
+    # schemas.folder.Folder embeds todos and their subtasks; load both levels
+    # up front so a folder list is three queries regardless of size.
+    return (selectinload(Folder.todos).selectinload(Todo.subtasks),)
 
-def create_folder(db: Session, folder: FolderCreate, user_id: int):
-    db_folder = Folder(**folder.model_dump(), user_id=user_id)
+async def get_folders(db: AsyncSession, user_id: int):
+    return (
+        await db.scalars(
+            select(Folder)
+            .options(*folder_load_options())
+            .where(Folder.user_id == user_id)
+        )
+    ).all()
+
+async def get_folder_rows(db: AsyncSession, user_id: int):
+    """get_folders as plain dicts shaped like schemas.folder.Folder."""
+    result = await db.execute(
+        select(Folder.title, Folder.id, Folder.user_id, Folder.version).where(Folder.user_id == user_id)
+    )
+    folders = [row._asdict() for row in result]
+    by_folder = {}
+    for folder in folders:
+        folder["todos"] = by_folder[folder["id"]] = []
+    folder_ids = list(by_folder)
+    todos = []
+    for start in range(0, len(folder_ids), IN_CHUNK_SIZE):
+        result = await db.execute(
+            select(*todo_columns())
+            .where(Todo.folder_id.in_(folder_ids[start:start + IN_CHUNK_SIZE]))
+            .order_by(Todo.position, Todo.id)
+        )
+        for row in result:
+            todo = row._asdict()
+            by_folder[todo["folder_id"]].append(todo)
+            todos.append(todo)
+    await attach_subtask_rows(db, todos)
+    return folders
+
+async def get_user_folder(db: AsyncSession, folder_id: int, user_id: int):
+    return await db.scalar(select(Folder).where(Folder.id == folder_id, Folder.user_id == user_id))
+
+async def get_folder_summaries(db: AsyncSession, user_id: int):
+    """Todo counts per folder, plus unfiled todos, from one GROUP BY.
+
+    Returns (folder rows, unfiled counts). Folders without todos get zero
+    counts; the unfiled bucket is the folder_id IS NULL group.
+    """
+    counts = (
+        select(
+            Todo.folder_id,
+            func.count().label("total_todos"),
+            func.count().filter(Todo.completed.is_(True)).label("completed_todos"),
+        )
+        .where(Todo.user_id == user_id)
+        .group_by(Todo.folder_id)
+        .cte("counts")
+    )
+    # A CTE read twice rather than a FULL JOIN, which SQLite only has
+    # since 3.39.
+    folders = (
+        select(
+            Folder.id,
+            Folder.title,
+            func.coalesce(counts.c.total_todos, 0).label("total_todos"),
+            func.coalesce(counts.c.completed_todos, 0).label("completed_todos"),
+        )
+        .outerjoin(counts, counts.c.folder_id == Folder.id)
+        .where(Folder.user_id == user_id)
+    )
+    unfiled = select(
+        literal(None).label("id"), literal(None).label("title"), counts.c.total_todos, counts.c.completed_todos
+    ).where(counts.c.folder_id.is_(None))
+    rows = (await db.execute(union_all(folders, unfiled).order_by("id"))).all()
+    summaries = [row._asdict() for row in rows if row.id is not None]
+    unfiled_row = next((row for row in rows if row.id is None), None)
+    unfiled_counts = {
+        "total_todos": unfiled_row.total_todos if unfiled_row else 0,
+        "completed_todos": unfiled_row.completed_todos if unfiled_row else 0,
+    }
+    return summaries, unfiled_counts
+
+async def create_folder(db: AsyncSession, folder: FolderCreate, user_id: int):
+    db_folder = Folder(**folder.model_dump(), user_id=user_id, version=await next_version(db, user_id), todos=[])
     db.add(db_folder)
-    db.commit()
-    db.refresh(db_folder)
+    await db.flush()
     return db_folder
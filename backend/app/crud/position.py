@@ -0,0 +1,74 @@
+"""Position keys of todos within a folder (see app.core.positions).
+
+Every function here runs after the caller's next_version, which holds the
+user's row lock until commit, so reads of existing keys and the keys written
+from them cannot interleave with another request of the same user.
+"""
+import logging
+from typing import Dict, Iterable, Optional
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.positions import keys_after
+from app.crud.version import next_version
+from app.models.todo import Todo
+
+logger = logging.getLogger(__name__)
+
+def _in_folder(folder_id: Optional[int]):
+    return Todo.folder_id.is_(None) if folder_id is None else Todo.folder_id == folder_id
+
+async def last_positions(db: AsyncSession, user_id: int, folder_ids: Iterable[Optional[int]]) -> Dict[Optional[int], Optional[str]]:
+    """The largest key in each of the user's folders (None: unfiled todos).
+
+    Folders without todos map to None, so keys_after() starts them afresh.
+    """
+    folder_ids = set(folder_ids)
+    last = dict.fromkeys(folder_ids)
+    if folder_ids:
+        rows = await db.execute(
+            select(Todo.folder_id, func.max(Todo.position))
+            .where(Todo.user_id == user_id, or_(*(_in_folder(folder_id) for folder_id in folder_ids)))
+            .group_by(Todo.folder_id)
+        )
+        last.update(rows.all())
+    return last
+
+async def rebalance_positions(db: AsyncSession, user_id: int, folder_id: Optional[int], version: int) -> int:
+    """Give the folder's todos short, evenly spaced keys in their current order.
+
+    Rewrites every todo in the folder (stamped with `version`, so sync
+    clients pick up the new keys) but leaves updated_at alone, since
+    reordering is not an edit as far as archiving is concerned.
+    """
+    ids = (
+        await db.scalars(
+            select(Todo.id).where(Todo.user_id == user_id, _in_folder(folder_id)).order_by(Todo.position, Todo.id)
+        )
+    ).all()
+    if ids:
+        # A Core executemany; the ORM's bulk UPDATE takes no WHERE clause.
+        todos = Todo.__table__
+        await db.execute(
+            update(todos)
+            .where(todos.c.id == bindparam("todo_id"))
+            .values(position=bindparam("new_position"), version=version, updated_at=todos.c.updated_at),
+            [{"todo_id": todo_id, "new_position": key} for todo_id, key in zip(ids, keys_after(None))],
+        )
+    return len(ids)
+
+async def rebalance_folder(user_id: int, folder_id: Optional[int]) -> None:
+    """Background rebalance, once a folder's keys grow past POSITION_REBALANCE_LENGTH."""
+    async with AsyncSessionLocal() as db:
+        version = await next_version(db, user_id)
+        longest = await db.scalar(
+            select(func.max(func.length(Todo.position))).where(Todo.user_id == user_id, _in_folder(folder_id))
+        )
+        if longest is None or longest <= settings.POSITION_REBALANCE_LENGTH:
+            # Another rebalance got here first.
+            await db.rollback()
+            return
+        count = await rebalance_positions(db, user_id, folder_id, version)
+        await db.commit()
+    logger.info("Rebalanced positions of %d todos for user %d", count, user_id)
@@ -0,0 +1,100 @@
+import re
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.todo import todo_load_options
+from app.models.folder import Folder
+from app.models.search import TS_CONFIG, title_tsvector
+from app.models.subtask import SubTask
+from app.models.todo import Todo
+
+# A todo's rank is its best match; hits on a subtask or on the todo's
+# folder count for less than a hit on the todo's own title.
+SUBTASK_WEIGHT = 0.5
+FOLDER_WEIGHT = 0.25
+
+def _terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())
+
+def _postgres_matches(user_id: int, terms: List[str]):
+    # Every term must match, each as a prefix, e.g. "grocer mil" finds
+    # "Groceries: milk".
+    tsquery = func.to_tsquery(TS_CONFIG, " & ".join(f"{term}:*" for term in terms))
+
+    def match(model, weight):
+        vector = title_tsvector(model.title)
+        return vector.op("@@")(tsquery), func.ts_rank(vector, tsquery) * weight
+
+    todo_hit, todo_rank = match(Todo, 1.0)
+    subtask_hit, subtask_rank = match(SubTask, SUBTASK_WEIGHT)
+    folder_hit, folder_rank = match(Folder, FOLDER_WEIGHT)
+    return union_all(
+        select(Todo.id.label("todo_id"), todo_rank.label("score")).where(Todo.user_id == user_id, todo_hit),
+        select(SubTask.todo_id, subtask_rank)
+        .join(Todo, Todo.id == SubTask.todo_id)
+        .where(Todo.user_id == user_id, subtask_hit),
+        select(Todo.id, folder_rank)
+        .join(Folder, Folder.id == Todo.folder_id)
+        .where(Todo.user_id == user_id, folder_hit),
+    )
+
+def _sqlite_matches(user_id: int, terms: List[str]):
+    match_expr = " ".join(f'"{term}"*' for term in terms)
+
+    def fts(name):
+        return table(name, column("rowid"))
+
+    def match(name, weight):
+        # bm25() is lower-is-better, so negate it into a score.
+        index = fts(name)
+        return index, literal_column(name).op("MATCH")(match_expr), -func.bm25(literal_column(name)) * weight
+
+    todo_fts, todo_hit, todo_rank = match("todos_fts", 1.0)
+    subtask_fts, subtask_hit, subtask_rank = match("subtasks_fts", SUBTASK_WEIGHT)
+    folder_fts, folder_hit, folder_rank = match("folders_fts", FOLDER_WEIGHT)
+    return union_all(
+        select(Todo.id.label("todo_id"), todo_rank.label("score"))
+        .join(todo_fts, todo_fts.c.rowid == Todo.id)
+        .where(Todo.user_id == user_id, todo_hit),
+        select(SubTask.todo_id, subtask_rank)
+        .join(subtask_fts, subtask_fts.c.rowid == SubTask.id)
+        .join(Todo, Todo.id == SubTask.todo_id)
+        .where(Todo.user_id == user_id, subtask_hit),
+        select(Todo.id, folder_rank)
+        .join(Folder, Folder.id == Todo.folder_id)
+        .join(folder_fts, folder_fts.c.rowid == Folder.id)
+        .where(Todo.user_id == user_id, folder_hit),
+    )
+
+async def search_todos(
+    db: AsyncSession, user_id: int, q: str, limit: int = 50, after: Optional[Tuple[float, int]] = None
+) -> List[Tuple[Todo, float]]:
+    """Todos matching q in their title, a subtask title or their folder name.
+
+    Ordered by (rank desc, id desc) and keyset-paged on that pair.
+    """
+    terms = _terms(q)
+    if not terms:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        matches = _postgres_matches(user_id, terms).subquery()
+    else:
+        matches = _sqlite_matches(user_id, terms).subquery()
+    ranked = (
+        select(matches.c.todo_id, func.max(matches.c.score).label("rank"))
+        .group_by(matches.c.todo_id)
+        .subquery()
+    )
+    query = (
+        select(Todo, ranked.c.rank)
+        .join(ranked, ranked.c.todo_id == Todo.id)
+        .options(*todo_load_options())
+        .order_by(ranked.c.rank.desc(), Todo.id.desc())
+        .limit(limit)
+    )
+    if after is not None:
+        after_rank, after_id = after
+        query = query.where(
+            or_(ranked.c.rank < after_rank, and_(ranked.c.rank == after_rank, Todo.id < after_id))
+        )
+    return (await db.execute(query)).all()
@@ -1,26 +1,141 @@
-from sqlalchemy.orm import Session
+from typing import Optional
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import discard_writes
+from app.crud.archive import unarchive_todos
+from app.crud.version import next_version, record_tombstones
 from app.models.subtask import SubTask
+from app.models.todo import Todo
 from app.schemas.subtask import SubTaskCreate
 
-def create_subtask(db: Session, subtask: SubTaskCreate, todo_id: int):
-    db_subtask = SubTask(**subtask.model_dump(), todo_id=todo_id)
+def _owned_by(user_id: int):
+    return SubTask.todo_id.in_(select(Todo.id).where(Todo.user_id == user_id))
+
+async def _adjust_counters(
+    db: AsyncSession, todo_id: int, version: int, total: int = 0, completed: int = 0,
+    sync_completed: bool = False, user_id: Optional[int] = None,
+) -> Optional[int]:
+    """Move the parent's counters; with user_id, only if the user owns it.
+
+    Returns the todo id, or None when no todo matched.
+    """
+    values = {
+        "total_subtasks": Todo.total_subtasks + total,
+        "completed_subtasks": Todo.completed_subtasks + completed,
+        "version": version,
+    }
+    if sync_completed:
+        # SET expressions see the pre-update row, so compare the new counts.
+        # A todo left without subtasks keeps its own completion.
+        new_total = Todo.total_subtasks + total
+        values["completed"] = case(
+            (new_total > 0, (Todo.completed_subtasks + completed) == new_total), else_=Todo.completed
+        )
+    query = update(Todo).where(Todo.id == todo_id)
+    if user_id is not None:
+        query = query.where(Todo.user_id == user_id)
+    return await db.scalar(
+        query.values(**values).returning(Todo.id).execution_options(synchronize_session=False)
+    )
+
+async def _sync_completed(db: AsyncSession, todo_id: int, version: int) -> bool:
+    """Set the todo's completion from its counters; False if it already matched."""
+    all_done = Todo.completed_subtasks == Todo.total_subtasks
+    synced = await db.scalar(
+        update(Todo)
+        .where(Todo.id == todo_id, Todo.total_subtasks > 0, Todo.completed.is_distinct_from(all_done))
+        .values(completed=all_done, version=version)
+        .returning(Todo.id)
+        .execution_options(synchronize_session=False)
+    )
+    return synced is not None
+
+async def refresh_subtask_counters(db: AsyncSession, todo_ids: set, version: int, sync_completed_ids: set = frozenset()):
+    """Recount counters for todos touched by bulk writes, in two UPDATEs."""
+    if not todo_ids:
+        return
+    total = select(func.count()).where(SubTask.todo_id == Todo.id).scalar_subquery()
+    done = select(func.count()).where(SubTask.todo_id == Todo.id, SubTask.completed.is_(True)).scalar_subquery()
+    await db.execute(
+        update(Todo)
+        .where(Todo.id.in_(todo_ids))
+        .values(total_subtasks=total, completed_subtasks=done, version=version)
+        .execution_options(synchronize_session=False)
+    )
+    if sync_completed_ids:
+        await db.execute(
+            update(Todo)
+            .where(Todo.id.in_(sync_completed_ids), Todo.total_subtasks > 0)
+            .values(completed=Todo.completed_subtasks == Todo.total_subtasks)
+            .execution_options(synchronize_session=False)
+        )
+
+async def create_subtask(db: AsyncSession, subtask: SubTaskCreate, todo_id: int, user_id: int) -> Optional[SubTask]:
+    """Add a subtask to one of the user's todos, or return None.
+
+    The parent's counter UPDATE doubles as the ownership check, so no read
+    precedes the INSERT.
+    """
+    version = await next_version(db, user_id)
+    counted = await _adjust_counters(db, todo_id, version, total=1, completed=int(subtask.completed), user_id=user_id)
+    if counted is None and await unarchive_todos(db, [todo_id], user_id, version):
+        counted = await _adjust_counters(db, todo_id, version, total=1, completed=int(subtask.completed), user_id=user_id)
+    if counted is None:
+        discard_writes(db)
+        return None
+    db_subtask = SubTask(**subtask.model_dump(), todo_id=todo_id, version=version)
     db.add(db_subtask)
-    db.commit()
-    db.refresh(db_subtask)
+    await db.flush()
     return db_subtask
 
-def update_subtask(db: Session, subtask_id: int, completed: bool):
-    db_subtask = db.query(SubTask).filter(SubTask.id == subtask_id).first()
-    if db_subtask:
-        db_subtask.completed = completed
-        db.add(db_subtask)
-        db.commit()
-        db.refresh(db_subtask)
+async def update_subtask(db: AsyncSession, todo_id: int, subtask_id: int, completed: bool, user_id: int) -> Optional[SubTask]:
+    """Set a subtask's completion and re-derive the parent's in one UPDATE.
+
+    The subtask UPDATE only matches when the value actually changes, which
+    tells us which way to move completed_subtasks without reading it first.
+    """
+    version = await next_version(db, user_id)
+    statement = (
+        update(SubTask)
+        .where(
+            SubTask.id == subtask_id,
+            SubTask.todo_id == todo_id,
+            _owned_by(user_id),
+            SubTask.completed.is_not(completed),
+        )
+        .values(completed=completed, version=version)
+        .returning(SubTask)
+    )
+    db_subtask = await db.scalar(statement)
+    if db_subtask is None and await unarchive_todos(db, [todo_id], user_id, version):
+        # A change to an archived todo's subtask restores the todo.
+        db_subtask = await db.scalar(statement)
+    if db_subtask is None:
+        # Unchanged (or missing): nothing to count, but the parent's
+        # completion is still re-derived, as it is after a change. If that
+        # changes nothing either, the version bump is not kept; expunge so
+        # the unit of work's rollback doesn't expire the subtask.
+        db_subtask = await db.scalar(
+            select(SubTask).where(SubTask.id == subtask_id, SubTask.todo_id == todo_id, _owned_by(user_id))
+        )
+        if db_subtask is None or not await _sync_completed(db, todo_id, version):
+            if db_subtask is not None:
+                db.expunge(db_subtask)
+            discard_writes(db)
+        return db_subtask
+    await _adjust_counters(db, todo_id, version, completed=1 if completed else -1, sync_completed=True)
     return db_subtask
 
-def delete_subtask(db: Session, subtask_id: int):
-    db_subtask = db.query(SubTask).filter(SubTask.id == subtask_id).first()
+async def delete_subtask(db: AsyncSession, subtask_id: int, user_id: int):
+    version = await next_version(db, user_id)
+    db_subtask = await db.scalar(
+        delete(SubTask).where(SubTask.id == subtask_id, _owned_by(user_id)).returning(SubTask)
+    )
     if db_subtask:
-        db.delete(db_subtask)
-        db.commit()
+        await record_tombstones(db, user_id, "subtask", [db_subtask.id], version)
+        await _adjust_counters(
+            db, db_subtask.todo_id, version, total=-1, completed=-int(db_subtask.completed), sync_completed=True
+        )
+    else:
+        discard_writes(db)
     return db_subtask
@@ -0,0 +1,47 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.crud.todo import todo_load_options
+from app.crud.version import get_version
+from app.models.folder import Folder
+from app.models.subtask import SubTask
+from app.models.todo import Todo
+from app.models.tombstone import Tombstone
+
+async def get_changes(db: AsyncSession, user_id: int, since: int):
+    """Everything written for the user after data_version `since`.
+
+    The current version is read first, so a write that commits while the
+    rows are being collected is at worst sent twice, never missed.
+    """
+    version = await get_version(db, user_id)
+    todos = await db.scalars(
+        select(Todo)
+        .options(*todo_load_options())
+        .where(Todo.user_id == user_id, Todo.version > since)
+        .order_by(Todo.id)
+    )
+    subtasks = await db.scalars(
+        select(SubTask)
+        .where(
+            SubTask.todo_id.in_(select(Todo.id).where(Todo.user_id == user_id)),
+            SubTask.version > since,
+        )
+        .order_by(SubTask.id)
+    )
+    folders = await db.scalars(
+        select(Folder).where(Folder.user_id == user_id, Folder.version > since).order_by(Folder.id)
+    )
+    tombstones = await db.scalars(
+        select(Tombstone)
+        .where(Tombstone.user_id == user_id, Tombstone.version > since)
+        .order_by(Tombstone.version)
+    )
+    return {
+        "version": version,
+        "todos": todos.all(),
+        "subtasks": subtasks.all(),
+        "folders": folders.all(),
+        "deleted": [
+            {"entity": t.entity, "id": t.entity_id, "version": t.version} for t in tombstones
+        ],
+    }
@@ -1,39 +1,239 @@
-from sqlalchemy.orm import Session
+from typing import List, Optional, Tuple, Union
+from sqlalchemy import case, delete, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.database import discard_writes
+from app.core.positions import key_between
+from app.crud.archive import unarchive_todos
+from app.crud.position import last_positions, rebalance_positions
+from app.crud.version import next_version, record_tombstones
+from app.models.archive import ArchivedSubTask, ArchivedTodo
+from app.models.subtask import SubTask
 from app.models.todo import Todo
 from app.schemas.todo import TodoCreate, TodoUpdate
 
-def get_todos(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(Todo).filter(Todo.user_id == user_id).offset(skip).limit(limit).all()
+def todo_load_options():
+    # Applied to every query whose result is serialized through
+    # schemas.todo.Todo, so subtasks arrive in one extra SELECT ... IN (...)
+    # instead of one lazy load per todo (which AsyncSession cannot do).
+    return (selectinload(Todo.subtasks),)
 
-def create_user_todo(db: Session, todo: TodoCreate, user_id: int):
-    db_todo = Todo(**todo.model_dump(), user_id=user_id)
+# Row-projection counterparts of the schemas, in schema field order so the
+# dicts built from them serialize to the same JSON as the Pydantic path.
+# The archive tables have the same columns.
+def todo_columns(model=Todo):
+    return (
+        model.title, model.completed, model.folder_id, model.id, model.user_id,
+        model.version, model.total_subtasks, model.completed_subtasks, model.position,
+    )
+
+def subtask_columns(model=SubTask):
+    return (model.id, model.title, model.completed, model.version)
+
+# Keeps IN (...) lists within driver parameter limits, as selectinload does.
+IN_CHUNK_SIZE = 500
+
+# Where a page resumes: a todo id, or (position, id) in one folder's list.
+PageKey = Union[int, Tuple[str, int]]
+
+def page_key(todo, folder_id: Optional[int]) -> tuple:
+    """Cursor parts for the page after `todo` (a row dict or entity)."""
+    if isinstance(todo, dict):
+        return (todo["id"],) if folder_id is None else (todo["position"], todo["id"])
+    return (todo.id,) if folder_id is None else (todo.position, todo.id)
+
+def _page(query, user_id: int, skip: int, limit: int, after: Optional[PageKey], folder_id: Optional[int]):
+    query = query.where(Todo.user_id == user_id)
+    if folder_id is None:
+        # Ordered by id so pages are stable; with `after` the (user_id, id)
+        # index serves the page as a range scan instead of an OFFSET walk.
+        query = query.order_by(Todo.id)
+        if after is not None:
+            query = query.where(Todo.id > after)
+    else:
+        # The folder in its user-defined order, from the (user_id,
+        # folder_id, position) index; id breaks ties.
+        query = query.where(Todo.folder_id == folder_id).order_by(Todo.position, Todo.id)
+        if after is not None:
+            query = query.where(tuple_(Todo.position, Todo.id) > tuple_(*after))
+    if after is None and skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+async def get_todos(
+    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100,
+    after: Optional[PageKey] = None, folder_id: Optional[int] = None,
+):
+    query = select(Todo).options(*todo_load_options())
+    return (await db.scalars(_page(query, user_id, skip, limit, after, folder_id))).all()
+
+async def get_todo_rows(
+    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100,
+    after: Optional[PageKey] = None, folder_id: Optional[int] = None,
+):
+    """get_todos as plain dicts shaped like schemas.todo.Todo.
+
+    Selecting columns rather than entities skips identity-map and attribute
+    instrumentation work, and the dicts need no validation before encoding.
+    """
+    result = await db.execute(_page(select(*todo_columns()), user_id, skip, limit, after, folder_id))
+    todos = [row._asdict() for row in result]
+    await attach_subtask_rows(db, todos)
+    return todos
+
+async def get_archived_todo_rows(db: AsyncSession, user_id: int, limit: int = 100, before_id: Optional[int] = None):
+    """The user's archived todos, newest first, shaped like schemas.todo.Todo."""
+    query = select(*todo_columns(ArchivedTodo)).where(ArchivedTodo.user_id == user_id)
+    if before_id is not None:
+        query = query.where(ArchivedTodo.id < before_id)
+    result = await db.execute(query.order_by(ArchivedTodo.id.desc()).limit(limit))
+    todos = [row._asdict() for row in result]
+    await attach_subtask_rows(db, todos, model=ArchivedSubTask)
+    return todos
+
+async def attach_subtask_rows(db: AsyncSession, todos: List[dict], model=SubTask):
+    """Set each todo dict's "subtasks" to its subtask rows, ordered by id.
+
+    `model` is SubTask, or ArchivedSubTask for archived todos.
+    """
+    by_todo = {}
+    for todo in todos:
+        todo["subtasks"] = by_todo[todo["id"]] = []
+    todo_ids = list(by_todo)
+    for start in range(0, len(todo_ids), IN_CHUNK_SIZE):
+        result = await db.execute(
+            select(model.todo_id, *subtask_columns(model))
+            .where(model.todo_id.in_(todo_ids[start:start + IN_CHUNK_SIZE]))
+            .order_by(model.id)
+        )
+        for todo_id, *values in result:
+            by_todo[todo_id].append(dict(zip(("id", "title", "completed", "version"), values)))
+
+async def create_user_todo(db: AsyncSession, todo: TodoCreate, user_id: int):
+    version = await next_version(db, user_id)
+    last = (await last_positions(db, user_id, [todo.folder_id]))[todo.folder_id]
+    db_todo = Todo(
+        **todo.model_dump(), user_id=user_id, version=version, position=key_between(last, None), subtasks=[]
+    )
     db.add(db_todo)
-    db.commit()
-    db.refresh(db_todo)
+    # One INSERT ... RETURNING id; the request's unit of work commits it.
+    await db.flush()
+    return db_todo
+
+async def update_todo(db: AsyncSession, todo_id: int, todo_update: TodoUpdate, user_id: int):
+    """UPDATE ... RETURNING with ownership in the WHERE clause; no prior read."""
+    version = await next_version(db, user_id)
+    values = todo_update.model_dump(exclude_unset=True)
+    if "folder_id" in values:
+        # A todo moved to another folder goes last there.
+        folder_id = values["folder_id"]
+        last = (await last_positions(db, user_id, [folder_id]))[folder_id]
+        values["position"] = case(
+            (Todo.folder_id.is_not_distinct_from(folder_id), Todo.position), else_=key_between(last, None)
+        )
+    statement = (
+        update(Todo)
+        .where(Todo.id == todo_id, Todo.user_id == user_id)
+        .values(**values, version=version)
+        .returning(Todo)
+        .options(*todo_load_options())
+    )
+    db_todo = await db.scalar(statement)
+    if db_todo is None and await unarchive_todos(db, [todo_id], user_id, version):
+        # Editing an archived todo brings it back.
+        db_todo = await db.scalar(statement)
+    if db_todo is None:
+        # Missing or not this user's: the version bump is not kept.
+        discard_writes(db)
     return db_todo
 
-def get_todo(db: Session, todo_id: int):
-    return db.query(Todo).filter(Todo.id == todo_id).first()
+async def delete_todo(db: AsyncSession, todo_id: int, user_id: int):
+    """Delete a todo and its subtasks with DELETE ... RETURNING, no prior read.
 
-def update_todo(db: Session, todo_id: int, todo_update: TodoUpdate, user_id: int):
-    db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
-    if not db_todo:
+    Subtasks go first (the foreign key would reject the todo otherwise) and
+    come back from RETURNING for the response.
+    """
+    version = await next_version(db, user_id)
+    owned = select(Todo.id).where(Todo.id == todo_id, Todo.user_id == user_id)
+    delete_subtasks = (
+        delete(SubTask)
+        .where(SubTask.todo_id.in_(owned))
+        .returning(SubTask)
+        .execution_options(synchronize_session=False)
+    )
+    delete_todo = (
+        delete(Todo)
+        .where(Todo.id == todo_id, Todo.user_id == user_id)
+        .returning(Todo)
+        .execution_options(synchronize_session=False)
+    )
+    subtasks = (await db.scalars(delete_subtasks)).all()
+    db_todo = await db.scalar(delete_todo)
+    if db_todo is None and await unarchive_todos(db, [todo_id], user_id, version):
+        subtasks = (await db.scalars(delete_subtasks)).all()
+        db_todo = await db.scalar(delete_todo)
+    if db_todo is None:
+        discard_writes(db)
         return None
-    
-    update_data = todo_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_todo, key, value)
-    
-    db.add(db_todo)
-    db.commit()
-    db.refresh(db_todo)
+    set_committed_value(db_todo, "subtasks", sorted(subtasks, key=lambda subtask: subtask.id))
+    await record_tombstones(db, user_id, "todo", [db_todo.id], version)
     return db_todo
 
-def delete_todo(db: Session, todo_id: int, user_id: int):
-    db_todo = db.query(Todo).filter(Todo.id == todo_id, Todo.user_id == user_id).first()
-    if not db_todo:
-        return None
-    
-    db.delete(db_todo)
-    db.commit()
+async def _move_bounds(db: AsyncSession, todo_id: int, user_id: int, after_id: Optional[int], before_id: Optional[int]):
+    """(folder_id, lower key, upper key) of the gap the todo moves into."""
+    anchor_id = after_id if after_id is not None else before_id
+    anchor = (
+        await db.execute(select(Todo.folder_id, Todo.position).where(Todo.id == anchor_id, Todo.user_id == user_id))
+    ).first()
+    if anchor is None:
+        raise ValueError("Neighbouring todo not found")
+    anchor_key = tuple_(anchor.position, anchor_id)
+    siblings = select(Todo.id, Todo.position).where(
+        Todo.user_id == user_id, Todo.folder_id.is_not_distinct_from(anchor.folder_id), Todo.id != todo_id
+    )
+    if after_id is not None:
+        siblings = siblings.where(tuple_(Todo.position, Todo.id) > anchor_key).order_by(Todo.position, Todo.id)
+    else:
+        siblings = siblings.where(tuple_(Todo.position, Todo.id) < anchor_key).order_by(
+            Todo.position.desc(), Todo.id.desc()
+        )
+    neighbour = (await db.execute(siblings.limit(1))).first()
+    if after_id is not None and before_id is not None and (neighbour is None or neighbour.id != before_id):
+        raise ValueError("The todos around the new position have changed")
+    neighbour_position = neighbour.position if neighbour is not None else None
+    if after_id is not None:
+        return anchor.folder_id, anchor.position, neighbour_position
+    return anchor.folder_id, neighbour_position, anchor.position
+
+async def move_todo(
+    db: AsyncSession, todo_id: int, user_id: int, after_id: Optional[int] = None, before_id: Optional[int] = None,
+):
+    """Place a todo right after `after_id` or right before `before_id`.
+
+    The todo joins the anchor's folder. Only the moved row is written: its
+    new key sorts between the anchor and the anchor's current neighbour.
+    Passing both ids asks for the gap between them, which must still be
+    adjacent. Returns None if the todo is missing; raises ValueError if the
+    anchor is missing or the neighbours have changed.
+    """
+    version = await next_version(db, user_id)
+    folder_id, lower, upper = await _move_bounds(db, todo_id, user_id, after_id, before_id)
+    if lower is not None and lower == upper:
+        # Equal keys (a restored todo can bring a duplicate) leave no room
+        # between them; re-space the folder first.
+        await rebalance_positions(db, user_id, folder_id, version)
+        folder_id, lower, upper = await _move_bounds(db, todo_id, user_id, after_id, before_id)
+    statement = (
+        update(Todo)
+        .where(Todo.id == todo_id, Todo.user_id == user_id)
+        .values(folder_id=folder_id, position=key_between(lower, upper), version=version)
+        .returning(Todo)
+        .options(*todo_load_options())
+    )
+    db_todo = await db.scalar(statement)
+    if db_todo is None and await unarchive_todos(db, [todo_id], user_id, version):
+        db_todo = await db.scalar(statement)
+    if db_todo is None:
+        discard_writes(db)
     return db_todo
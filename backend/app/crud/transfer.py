@@ -0,0 +1,206 @@
+"""Bulk export and import of a user's folders, todos and subtasks as NDJSON.
+
+Export streams one line per row (see schemas/transfer) from server-side
+cursors, TRANSFER_CHUNK_SIZE rows per fetch, so memory stays flat however
+much the user has. Folders come first, then todos in each folder's order,
+then subtasks, so every reference points at an earlier line.
+
+Import reads the same format and writes TRANSFER_CHUNK_SIZE lines per
+transaction: one next_version, then one bulk insert per table (COPY on
+asyncpg, a multi-row INSERT elsewhere). A failed line leaves the chunks
+before it committed; ImportFailed says how far the import got.
+"""
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import column, func, insert, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, read_session
+from app.core.positions import keys_after
+from app.core.serialization import dumps_json
+from app.crud.position import last_positions
+from app.crud.subtask import refresh_subtask_counters
+from app.crud.version import next_version
+from app.models.archive import ArchivedSubTask, ArchivedTodo
+from app.models.folder import Folder
+from app.models.subtask import SubTask
+from app.models.todo import Todo, utcnow
+from app.schemas.transfer import FolderRecord, ImportResult, SubTaskRecord, TodoRecord, record_adapter
+
+# Longest accepted import line; real records are far shorter.
+MAX_LINE_BYTES = 64 * 1024
+
+# Tables whose rows are moved into an archive table with their ids.
+ARCHIVES = {"todos": ArchivedTodo.__table__, "subtasks": ArchivedSubTask.__table__}
+sqlite_sequence = table("sqlite_sequence", column("name"), column("seq"))
+
+def _export_queries(user_id: int):
+    yield "folder", {}, select(Folder.id, Folder.title).where(Folder.user_id == user_id).order_by(Folder.id)
+    for model, extra in ((Todo, {}), (ArchivedTodo, {"archived": True})):
+        yield "todo", extra, (
+            select(model.id, model.title, model.completed, model.folder_id)
+            .where(model.user_id == user_id)
+            .order_by(model.folder_id, model.position, model.id)
+        )
+    for model, parent in ((SubTask, Todo), (ArchivedSubTask, ArchivedTodo)):
+        yield "subtask", {}, (
+            select(model.id, model.todo_id, model.title, model.completed)
+            .where(model.todo_id.in_(select(parent.id).where(parent.user_id == user_id)))
+            .order_by(model.todo_id, model.id)
+        )
+
+async def export_lines(user_id: int) -> AsyncIterator[bytes]:
+    """The user's data as NDJSON, one chunk of lines per fetch."""
+    async with read_session(user_id) as db:
+        if db.get_bind().dialect.name == "postgresql":
+            # One snapshot for every query, so no line references a row
+            # written after an earlier query ran.
+            await db.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+        for kind, extra, query in _export_queries(user_id):
+            result = await db.stream(query.execution_options(yield_per=settings.TRANSFER_CHUNK_SIZE))
+            async for rows in result.partitions():
+                yield b"".join(dumps_json({"type": kind, **row._mapping, **extra}) + b"\n" for row in rows)
+
+class ImportFailed(ValueError):
+    def __init__(self, message: str, imported: ImportResult):
+        super().__init__(message)
+        self.imported = imported
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line longer than {MAX_LINE_BYTES} bytes")
+    yield buffer
+
+async def _allocate_ids(db: AsyncSession, table, count: int) -> List[int]:
+    if db.get_bind().dialect.name == "postgresql":
+        return (
+            await db.scalars(
+                select(func.nextval(func.pg_get_serial_sequence(table.name, "id")))
+                .select_from(func.generate_series(1, count))
+            )
+        ).all()
+    # SQLite lets one transaction write at a time, and this one has written
+    # (next_version) already, so nobody else can take these ids before commit.
+    # Start past every id in use, archived, or handed out before (the
+    # AUTOINCREMENT sequence), as the table's own inserts would.
+    used = [
+        select(func.max(table.c.id)).scalar_subquery(),
+        select(sqlite_sequence.c.seq).where(sqlite_sequence.c.name == table.name).scalar_subquery(),
+    ]
+    if table.name in ARCHIVES:
+        used.append(select(func.max(ARCHIVES[table.name].c.id)).scalar_subquery())
+    start = (await db.scalar(select(func.max(*(func.coalesce(ids, 0) for ids in used))))) + 1
+    return list(range(start, start + count))
+
+async def _insert(db: AsyncSession, model, rows: List[dict]) -> List[int]:
+    """Insert rows (all with the same keys) and return their new ids in order.
+
+    Ids are assigned up front rather than read back with RETURNING: COPY
+    returns nothing, and SQLite can only match RETURNING rows to parameters
+    by inserting one row per statement.
+    """
+    table = model.__table__
+    ids = await _allocate_ids(db, table, len(rows))
+    if db.get_bind().dialect.driver == "asyncpg":
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            table.name,
+            columns=["id", *rows[0]],
+            records=[(new_id, *row.values()) for new_id, row in zip(ids, rows)],
+        )
+    else:
+        await db.execute(insert(table), [{"id": new_id, **row} for new_id, row in zip(ids, rows)])
+    return ids
+
+class _Import:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # Ids from the file to the ids they were imported as.
+        self.folder_ids: Dict[int, int] = {}
+        self.todo_ids: Dict[int, int] = {}
+        self.imported = ImportResult()
+
+    def _map(self, ids: Dict[int, int], old_id: Optional[int], line: int, name: str) -> Optional[int]:
+        if old_id is None:
+            return None
+        if old_id not in ids:
+            raise ValueError(f"Line {line}: {name} {old_id} does not appear on an earlier line")
+        return ids[old_id]
+
+    def _remember(self, ids: Dict[int, int], records, new_ids: List[int], name: str) -> None:
+        for (line, record), new_id in zip(records, new_ids):
+            if record.id in ids:
+                raise ValueError(f"Line {line}: duplicate {name} id {record.id}")
+            ids[record.id] = new_id
+
+    async def write_chunk(self, records: list) -> None:
+        folders = [(line, r) for line, r in records if isinstance(r, FolderRecord)]
+        todos = [(line, r) for line, r in records if isinstance(r, TodoRecord)]
+        subtasks = [(line, r) for line, r in records if isinstance(r, SubTaskRecord)]
+        async with AsyncSessionLocal() as db:
+            version = await next_version(db, self.user_id)
+            if folders:
+                rows = [{"title": r.title, "user_id": self.user_id, "version": version} for _, r in folders]
+                self._remember(self.folder_ids, folders, await _insert(db, Folder, rows), "folder")
+            if todos:
+                folder_ids = [self._map(self.folder_ids, r.folder_id, line, "folder_id") for line, r in todos]
+                last = await last_positions(db, self.user_id, folder_ids)
+                keys = {folder_id: keys_after(key) for folder_id, key in last.items()}
+                now = utcnow()
+                # Subtask counters start at zero and are recounted as the
+                # subtasks arrive.
+                rows = [
+                    {
+                        "title": r.title, "completed": r.completed, "user_id": self.user_id, "folder_id": folder_id,
+                        "version": version, "total_subtasks": 0, "completed_subtasks": 0,
+                        "updated_at": now, "position": next(keys[folder_id]),
+                    }
+                    for (_, r), folder_id in zip(todos, folder_ids)
+                ]
+                self._remember(self.todo_ids, todos, await _insert(db, Todo, rows), "todo")
+            if subtasks:
+                todo_ids = [self._map(self.todo_ids, r.todo_id, line, "todo_id") for line, r in subtasks]
+                rows = [
+                    {"title": r.title, "completed": r.completed, "todo_id": todo_id, "version": version}
+                    for (_, r), todo_id in zip(subtasks, todo_ids)
+                ]
+                await _insert(db, SubTask, rows)
+                await refresh_subtask_counters(db, set(todo_ids), version)
+            await db.commit()
+        self.imported.folders += len(folders)
+        self.imported.todos += len(todos)
+        self.imported.subtasks += len(subtasks)
+
+async def import_lines(user_id: int, chunks: AsyncIterable[bytes]) -> ImportResult:
+    """Import an NDJSON body (as produced by export_lines) for the user.
+
+    Raises ImportFailed on the first malformed or dangling line.
+    """
+    job = _Import(user_id)
+    records = []
+    line = 0
+    try:
+        async for raw in _lines(chunks):
+            line += 1
+            if not raw.strip():
+                continue
+            try:
+                records.append((line, record_adapter.validate_json(raw)))
+            except ValidationError as e:
+                error = e.errors()[0]
+                location = ".".join(str(part) for part in error["loc"])
+                raise ValueError(f"Line {line}: {location}: {error['msg']}" if location else f"Line {line}: {error['msg']}")
+            if len(records) >= settings.TRANSFER_CHUNK_SIZE:
+                await job.write_chunk(records)
+                records = []
+        if records:
+            await job.write_chunk(records)
+    except ValueError as e:
+        raise ImportFailed(str(e), job.imported) from e
+    return job.imported
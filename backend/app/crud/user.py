@@ -1,19 +1,30 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.user import User
 from app.schemas.user import UserCreate
-from app.core.security import get_password_hash
+from app.core.security import hash_password
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.scalar(select(User).where(User.id == user_id))
 
-def create_user(db: Session, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email))
+
+async def create_user(db: AsyncSession, user: UserCreate):
+    hashed_password = await hash_password(user.password)
     db_user = User(
         email=user.email,
         hashed_password=hashed_password,
         full_name=user.full_name
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # Column defaults are applied client-side, so the INSERT's RETURNING id
+    # leaves nothing to refresh.
+    await db.flush()
     return db_user
+
+async def update_password_hash(db: AsyncSession, user: User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.add(user)
+    await db.flush()
+    return user
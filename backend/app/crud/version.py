@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Iterable, Set
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.cache import response_cache
+from app.core.database import replicas
+from app.core.events import change_feed
+from app.models.tombstone import Tombstone
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Session.info key for users whose data_version the session bumped.
+WRITERS_KEY = "data_version_writers"
+
+# Cache evictions in flight; holds a reference until each finishes.
+_evictions: Set[asyncio.Task] = set()
+
+async def next_version(db: AsyncSession, user_id: int) -> int:
+    """Bump and return the user's data_version inside the current transaction.
+
+    Every write to a user's todos, subtasks or folders stamps the touched
+    rows with this value, so "version > since" finds everything that changed.
+    Once the write commits, open change streams are told about the
+    version, the user's reads stick to the primary for
+    READ_YOUR_WRITES_SECONDS and their cached list responses are dropped.
+    Those are keyed by the version, so dropping them only releases memory;
+    a stale entry can never match the new version. A rolled-back write
+    does none of this.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(data_version=User.data_version + 1)
+        .returning(User.data_version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one()
+    db.info.setdefault(WRITERS_KEY, set()).add(user_id)
+    await change_feed.stage(db, user_id, version)
+    return version
+
+async def _evict_cached_responses(user_id: int) -> None:
+    try:
+        await response_cache.invalidate(user_id)
+    except Exception:
+        logger.warning("Could not drop cached responses for user %s", user_id, exc_info=True)
+
+@event.listens_for(Session, "after_commit")
+def _after_write_commit(session):
+    writers = session.info.pop(WRITERS_KEY, None)
+    if not writers:
+        return
+    for user_id in writers:
+        replicas.note_write(user_id)
+        if response_cache.enabled:
+            task = asyncio.get_running_loop().create_task(_evict_cached_responses(user_id))
+            _evictions.add(task)
+            task.add_done_callback(_evictions.discard)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_writers(session):
+    session.info.pop(WRITERS_KEY, None)
+
+async def get_version(db: AsyncSession, user_id: int) -> int:
+    return (await db.execute(select(User.data_version).where(User.id == user_id))).scalar_one()
+
+async def record_tombstones(db: AsyncSession, user_id: int, entity: str, entity_ids: Iterable[int], version: int):
+    rows = [
+        {"user_id": user_id, "entity": entity, "entity_id": entity_id, "version": version}
+        for entity_id in entity_ids
+    ]
+    if rows:
+        await db.execute(insert(Tombstone), rows)
@@ -1,26 +1,87 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import configure_mappers
+from starlette.concurrency import run_in_threadpool
+from app import migrations
 from app.core.config import settings
-from app.core.database import Base, engine
+from app.core.database import async_engine, engine, pool_stats, replicas, warm_up
+from app.core.events import change_feed
+from app.core.idempotency import REPLAYED_HEADER, IdempotencyMiddleware
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.security import PasswordHasherBusy
+from app.crud.archive import archiver
 from app.api import auth, todos, folders
 from app.models import user
 from app.models import todo
 from app.models import folder
 from app.models import subtask
+from app.models import tombstone
+from app.models import search
+from app.models import archive
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title=settings.PROJECT_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here runs at import, so the app can be imported (and its
+    # OpenAPI schema generated) without a database.
+    if settings.MIGRATE_ON_STARTUP:
+        # Every worker runs this; the migration lock lets only one apply.
+        await run_in_threadpool(migrations.upgrade, engine)
+    # Resolve relationships now rather than during the first request.
+    configure_mappers()
+    if settings.DB_WARMUP_CONNECTIONS:
+        try:
+            await warm_up(settings.DB_WARMUP_CONNECTIONS)
+        except Exception:
+            # Serve anyway; the pool connects on demand once the database is up.
+            logger.warning("Database warm-up failed", exc_info=True)
+    await change_feed.start()
+    await archiver.start()
+    yield
+    await archiver.stop()
+    await change_feed.stop()
+    await replicas.dispose()
+    await async_engine.dispose()
 
-from fastapi.middleware.cors import CORSMiddleware
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
+# Inside CORS, so replayed responses get CORS headers like fresh ones.
+app.add_middleware(IdempotencyMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", REPLAYED_HEADER],
 )
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication is temporarily overloaded, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT.
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The database is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+# Added last so it wraps everything else, CORS included.
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(todos.router)
 app.include_router(folders.router)
@@ -28,3 +89,14 @@ app.include_router(folders.router)
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/health/pool", include_in_schema=False)
+def pool_health():
+    return {
+        "primary": pool_stats(async_engine),
+        "replicas": [pool_stats(replica) for replica in replicas.engines],
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
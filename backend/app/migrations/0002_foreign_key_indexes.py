@@ -0,0 +1,19 @@
+"""Index the foreign keys used by per-user lists, ownership checks and
+cascades.
+
+todos.user_id is left out: ix_todos_user_id_id leads with it and already
+serves every user_id lookup.
+"""
+from app.migrations import create_index
+
+TRANSACTIONAL = False
+
+INDEXES = [
+    ("ix_todos_folder_id", "todos (folder_id)"),
+    ("ix_subtasks_todo_id", "subtasks (todo_id)"),
+    ("ix_folders_user_id", "folders (user_id)"),
+]
+
+def upgrade(connection):
+    for name, definition in INDEXES:
+        create_index(connection, name, definition)
@@ -0,0 +1,11 @@
+"""Partial index over each user's incomplete todos.
+
+Most todos end up completed, so this stays a fraction of the size of
+ix_todos_user_id_id while serving the "what's left to do" lists.
+"""
+from app.migrations import create_index
+
+TRANSACTIONAL = False
+
+def upgrade(connection):
+    create_index(connection, "ix_todos_user_id_active", "todos (user_id, id)", where="completed = false")
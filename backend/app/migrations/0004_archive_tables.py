@@ -0,0 +1,53 @@
+"""Archive tables for completed todos, and todos.updated_at to age them.
+
+Existing todos start their clock at upgrade time, so nothing is archived
+until it has gone untouched for the configured age after this release.
+The column is added with a constant default, which Postgres applies
+without rewriting the table; the default is dropped again afterwards.
+The archive tables are spelled out as they were at this release; later
+columns come from later migrations.
+"""
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, inspect, text
+
+from app.migrations import logger
+from app.models.todo import utcnow
+
+metadata = MetaData()
+
+# Referenced by the foreign keys below; never created here.
+users = Table("users", metadata, Column("id", Integer, primary_key=True))
+folders = Table("folders", metadata, Column("id", Integer, primary_key=True))
+
+archived_todos = Table(
+    "archived_todos",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("title", String),
+    Column("completed", Boolean),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("folder_id", Integer, ForeignKey("folders.id"), nullable=True),
+    Column("version", Integer, nullable=False),
+    Column("total_subtasks", Integer, nullable=False),
+    Column("completed_subtasks", Integer, nullable=False),
+    Column("updated_at", DateTime),
+    Index("ix_archived_todos_user_id_id", "user_id", "id"),
+)
+
+archived_subtasks = Table(
+    "archived_subtasks",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("title", String),
+    Column("completed", Boolean),
+    Column("todo_id", Integer, ForeignKey("archived_todos.id"), index=True),
+    Column("version", Integer, nullable=False),
+)
+
+def upgrade(connection):
+    if "updated_at" not in {c["name"] for c in inspect(connection).get_columns("todos")}:
+        logger.info("Adding updated_at column to todos table...")
+        now = utcnow().isoformat(sep=" ", timespec="seconds")
+        connection.execute(text(f"ALTER TABLE todos ADD COLUMN updated_at TIMESTAMP DEFAULT '{now}'"))
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("ALTER TABLE todos ALTER COLUMN updated_at DROP DEFAULT"))
+    metadata.create_all(connection, tables=[archived_todos, archived_subtasks])
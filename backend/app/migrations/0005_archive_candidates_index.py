@@ -0,0 +1,7 @@
+"""Partial index the archiver scans for completed todos, oldest first."""
+from app.migrations import create_index
+
+TRANSACTIONAL = False
+
+def upgrade(connection):
+    create_index(connection, "ix_todos_archive_candidates", "todos (updated_at)", where="completed = true")
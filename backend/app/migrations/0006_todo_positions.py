@@ -0,0 +1,88 @@
+"""todos.position (and archived_todos.position) for user-defined order.
+
+Existing todos keep their id order: each user's folder, and their unfiled
+todos, get consecutive keys, with archived todos numbered alongside so a
+restored todo returns to its old place.
+
+Runs outside a transaction so a large backfill doesn't hold locks for its
+whole length: both tables are read in id order, CHUNK_SIZE rows at a time,
+and each chunk's keys commit on their own. A rerun skips rows that already
+have a key and continues each scope after its last one. On Postgres, NOT
+NULL is proven by validating a CHECK constraint, which doesn't block
+writes, so SET NOT NULL itself needs no table scan.
+"""
+import heapq
+
+from sqlalchemy import inspect, text
+
+from app.core.positions import key_between
+from app.migrations import logger
+
+TRANSACTIONAL = False
+
+TABLES = ("todos", "archived_todos")
+CHUNK_SIZE = 1000
+NOT_NULL_CHECK = "todos_position_not_null"
+
+def _rows(connection, table):
+    """(id, user_id, folder_id, position, table) for every row, in id order."""
+    after = 0
+    while True:
+        rows = connection.execute(
+            text(f"SELECT id, user_id, folder_id, position FROM {table} WHERE id > :after ORDER BY id LIMIT :limit"),
+            {"after": after, "limit": CHUNK_SIZE},
+        ).all()
+        for row in rows:
+            yield (*row, table)
+        if len(rows) < CHUNK_SIZE:
+            return
+        after = rows[-1].id
+
+def _write(connection, table, params):
+    logger.info("Backfilling %s.position for %d rows...", table, len(params))
+    with connection.engine.begin() as chunk:
+        chunk.execute(text(f"UPDATE {table} SET position = :position WHERE id = :id AND position IS NULL"), params)
+
+def _backfill(connection):
+    # Last key handed out in each (user_id, folder_id) scope.
+    last = {}
+    updates = {table: [] for table in TABLES}
+    for todo_id, user_id, folder_id, position, table in heapq.merge(
+        *(_rows(connection, t) for t in TABLES), key=lambda row: row[0]
+    ):
+        scope = (user_id, folder_id)
+        if position is None:
+            position = key_between(last.get(scope), None)
+            updates[table].append({"id": todo_id, "position": position})
+            if len(updates[table]) >= CHUNK_SIZE:
+                _write(connection, table, updates[table])
+                updates[table] = []
+        last[scope] = position
+    for table, params in updates.items():
+        if params:
+            _write(connection, table, params)
+
+def _set_not_null(connection):
+    exists = connection.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": NOT_NULL_CHECK}
+    ).first()
+    if not exists:
+        connection.execute(text(
+            f"ALTER TABLE todos ADD CONSTRAINT {NOT_NULL_CHECK} CHECK (position IS NOT NULL) NOT VALID"
+        ))
+    logger.info("Validating todos.position is set...")
+    connection.execute(text(f"ALTER TABLE todos VALIDATE CONSTRAINT {NOT_NULL_CHECK}"))
+    connection.execute(text("ALTER TABLE todos ALTER COLUMN position SET NOT NULL"))
+    connection.execute(text(f"ALTER TABLE todos DROP CONSTRAINT IF EXISTS {NOT_NULL_CHECK}"))
+
+def upgrade(connection):
+    postgres = connection.dialect.name == "postgresql"
+    column_type = 'VARCHAR COLLATE "C"' if postgres else "VARCHAR"
+    inspector = inspect(connection)
+    for table in TABLES:
+        if "position" not in {c["name"] for c in inspector.get_columns(table)}:
+            logger.info("Adding position column to %s table...", table)
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN position {column_type}"))
+    _backfill(connection)
+    if postgres:
+        _set_not_null(connection)
@@ -0,0 +1,7 @@
+"""Index for listing a folder's todos in position order."""
+from app.migrations import create_index
+
+TRANSACTIONAL = False
+
+def upgrade(connection):
+    create_index(connection, "ix_todos_user_id_folder_id_position", "todos (user_id, folder_id, position)")
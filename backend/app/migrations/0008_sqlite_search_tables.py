@@ -0,0 +1,32 @@
+"""SQLite full-text search tables for databases created before search.
+
+Their todos, subtasks and folders tables predate the FTS5 tables and
+triggers that create_all adds alongside new tables, so create them here
+and rebuild each index from its content table. Postgres search runs off
+GIN indexes instead (see 0009).
+"""
+from sqlalchemy import text
+
+from app.migrations import logger
+
+TABLES = ("todos", "subtasks", "folders")
+
+def upgrade(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for table in TABLES:
+        fts = f"{table}_fts"
+        logger.info("Ensuring full-text search table %s...", fts)
+        for statement in (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(title, content='{table}', content_rowid='id')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF title ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title); "
+            f"INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title); END",
+            # Index the rows written before the triggers existed.
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ):
+            connection.execute(text(statement))
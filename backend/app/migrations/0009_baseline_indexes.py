@@ -0,0 +1,26 @@
+"""Indexes 0001 used to build inside its transaction.
+
+Keyset pagination, delta sync and (on Postgres) title search. Databases
+that already have them skip each one; the rest build them without
+blocking writes.
+"""
+from app.migrations import create_index
+
+TRANSACTIONAL = False
+
+INDEXES = [
+    ("ix_todos_user_id_id", "todos (user_id, id)"),
+    ("ix_todos_user_id_version", "todos (user_id, version)"),
+    ("ix_folders_user_id_version", "folders (user_id, version)"),
+]
+
+POSTGRES_INDEXES = [
+    ("ix_todos_title_fts", "todos USING gin (to_tsvector('simple'::regconfig, title))"),
+    ("ix_subtasks_title_fts", "subtasks USING gin (to_tsvector('simple'::regconfig, title))"),
+    ("ix_folders_title_fts", "folders USING gin (to_tsvector('simple'::regconfig, title))"),
+]
+
+def upgrade(connection):
+    indexes = INDEXES + (POSTGRES_INDEXES if connection.dialect.name == "postgresql" else [])
+    for name, definition in indexes:
+        create_index(connection, name, definition)
@@ -0,0 +1,65 @@
+"""AUTOINCREMENT ids for todos and subtasks on SQLite.
+
+A plain INTEGER PRIMARY KEY hands out max(id) + 1, so once the newest todo
+is archived (deleted from todos) its id goes to the next new todo, and the
+archived one can no longer be restored or told apart from it. SQLite cannot
+alter a primary key in place: each table is rebuilt with AUTOINCREMENT,
+keeping its rows, indexes and triggers, and its sequence starts past every
+id the archive still holds. Postgres sequences never go back, so it needs
+nothing.
+"""
+from sqlalchemy import text
+
+from app.migrations import logger
+
+# Each table with the archive table that keeps its ids.
+TABLES = (("todos", "archived_todos"), ("subtasks", "archived_subtasks"))
+
+def _table_sql(connection, name):
+    return connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+    ).scalar()
+
+def _create_statement(connection, table, new_name):
+    columns = []
+    for _, name, type_, notnull, default, pk in connection.execute(text(f"PRAGMA table_info({table})")):
+        column = f"{name} {type_}"
+        if notnull:
+            column += " NOT NULL"
+        if default is not None:
+            column += f" DEFAULT {default}"
+        if pk:
+            column += " PRIMARY KEY AUTOINCREMENT"
+        columns.append(column)
+    for _, _, referred, name, referred_name, *_ in connection.execute(text(f"PRAGMA foreign_key_list({table})")):
+        columns.append(f"FOREIGN KEY({name}) REFERENCES {referred} ({referred_name})")
+    return f"CREATE TABLE {new_name} (\n\t" + ", \n\t".join(columns) + "\n)"
+
+def _rebuild(connection, table, archive):
+    new_name = f"{table}_autoincrement"
+    # Left over if an earlier run stopped before its copy committed.
+    connection.execute(text(f"DROP TABLE IF EXISTS {new_name}"))
+    logger.info("Rebuilding %s table with AUTOINCREMENT ids...", table)
+    # Indexes and triggers go with the old table; recreate them after.
+    dependents = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE tbl_name = :table AND type IN ('index', 'trigger') AND sql IS NOT NULL"),
+        {"table": table},
+    ).scalars().all()
+    connection.execute(text(_create_statement(connection, table, new_name)))
+    connection.execute(text(f"INSERT INTO {new_name} SELECT * FROM {table}"))
+    connection.execute(text(f"DROP TABLE {table}"))
+    connection.execute(text(f"ALTER TABLE {new_name} RENAME TO {table}"))
+    for statement in dependents:
+        connection.execute(text(statement))
+    last_id = connection.execute(
+        text(f"SELECT max(coalesce((SELECT max(id) FROM {table}), 0), coalesce((SELECT max(id) FROM {archive}), 0))")
+    ).scalar()
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :table"), {"table": table})
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)"), {"table": table, "seq": last_id})
+
+def upgrade(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for table, archive in TABLES:
+        if "AUTOINCREMENT" not in _table_sql(connection, table).upper():
+            _rebuild(connection, table, archive)
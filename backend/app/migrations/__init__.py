@@ -0,0 +1,124 @@
+"""Versioned schema migrations.
+
+Each module in this package named ``NNNN_description.py`` is one migration:
+it defines ``upgrade(connection)`` and runs inside a transaction unless it
+sets ``TRANSACTIONAL = False`` (needed for CREATE INDEX CONCURRENTLY).
+Applied versions are recorded in the ``schema_migrations`` table, so each
+migration runs once per database, in order.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from datetime import datetime, timezone
+from typing import List, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+
+logger = logging.getLogger(__name__)
+
+MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+# Arbitrary key for pg_advisory_lock, so concurrent deploys don't race.
+LOCK_KEY = 7294013
+
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    module: object
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "TRANSACTIONAL", True)
+
+def discover() -> List[Migration]:
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = MODULE_NAME.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+def applied_versions(engine) -> set:
+    with engine.begin() as connection:
+        metadata.create_all(connection)
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+def pending(engine) -> List[Migration]:
+    done = applied_versions(engine)
+    return [m for m in discover() if m.version not in done]
+
+def _apply(engine, migration: Migration):
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.module.upgrade(connection)
+            _record(connection, migration)
+    else:
+        # Each statement commits on its own. Non-transactional migrations
+        # must be idempotent, since a crash can leave them half-applied.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            migration.module.upgrade(connection)
+            _record(connection, migration)
+
+def _record(connection, migration: Migration):
+    connection.execute(
+        schema_migrations.insert().values(
+            version=migration.version, name=migration.name, applied_at=datetime.now(timezone.utc)
+        )
+    )
+
+def upgrade(engine) -> List[Migration]:
+    """Apply every pending migration in order and return the ones applied."""
+    lock = None
+    if engine.dialect.name == "postgresql":
+        # Autocommit, so the idle lock holder has no open transaction for
+        # CREATE INDEX CONCURRENTLY to wait on.
+        lock = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+    try:
+        applied = []
+        for migration in pending(engine):
+            logger.info("Applying %04d_%s...", migration.version, migration.name)
+            _apply(engine, migration)
+            applied.append(migration)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+            lock.close()
+
+def create_index(connection, name, definition, where=None):
+    """Create an index if missing, without blocking writes on Postgres.
+
+    A failed CONCURRENTLY build leaves an invalid index behind that IF NOT
+    EXISTS would skip, so it is dropped and rebuilt.
+    """
+    logger.info("Ensuring index %s...", name)
+    statement = f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"
+    if where:
+        statement += f" WHERE {where}"
+    if connection.dialect.name != "postgresql":
+        connection.execute(text(statement))
+        return
+    invalid = connection.execute(
+        text("SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name AND NOT i.indisvalid"),
+        {"name": name},
+    ).first()
+    if invalid:
+        logger.info("Dropping invalid index %s...", name)
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    connection.execute(text(statement.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)))
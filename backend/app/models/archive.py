@@ -0,0 +1,33 @@
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String
+from app.core.database import Base
+from app.models.todo import PositionKey
+
+# Completed todos moved out of the hot tables by crud/archive, with their
+# subtasks. Same columns and ids as todos/subtasks so a todo can be restored
+# exactly as it was.
+
+class ArchivedTodo(Base):
+    __tablename__ = "archived_todos"
+    __table_args__ = (
+        Index("ix_archived_todos_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    completed = Column(Boolean, default=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    version = Column(Integer, default=0, nullable=False)
+    total_subtasks = Column(Integer, default=0, nullable=False)
+    completed_subtasks = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime)
+    position = Column(PositionKey)
+
+class ArchivedSubTask(Base):
+    __tablename__ = "archived_subtasks"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    completed = Column(Boolean, default=False)
+    todo_id = Column(Integer, ForeignKey("archived_todos.id"), index=True)
+    version = Column(Integer, default=0, nullable=False)
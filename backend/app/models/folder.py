@@ -1,13 +1,17 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 class Folder(Base):
     __tablename__ = "folders"
+    __table_args__ = (
+        Index("ix_folders_user_id_version", "user_id", "version"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    version = Column(Integer, default=0, nullable=False)
 
     owner = relationship("User", back_populates="folders")
-    todos = relationship("Todo", back_populates="folder")
+    todos = relationship("Todo", back_populates="folder", order_by="(Todo.position, Todo.id)")
@@ -0,0 +1,40 @@
+"""Full-text search structures for todo, subtask and folder titles.
+
+Postgres gets GIN indexes over to_tsvector('simple', title); SQLite gets
+FTS5 external-content tables kept in sync by triggers. Both are created
+alongside their tables by metadata.create_all; migrations add them to
+databases whose tables already existed.
+"""
+from sqlalchemy import DDL, Index, event, func, text
+from app.models.folder import Folder
+from app.models.subtask import SubTask
+from app.models.todo import Todo
+
+# Language-neutral: no stemming or stop words, since titles are short and
+# users write them in any language. Inlined so queries match the index.
+TS_CONFIG = text("'simple'::regconfig")
+
+def title_tsvector(column):
+    return func.to_tsvector(TS_CONFIG, column)
+
+SEARCHABLE = (Todo, SubTask, Folder)
+
+for model in SEARCHABLE:
+    table = model.__table__
+    Index(
+        f"ix_{table.name}_title_fts", title_tsvector(model.title), postgresql_using="gin"
+    ).ddl_if(dialect="postgresql")
+
+    fts = f"{table.name}_fts"
+    for statement in (
+        f"CREATE VIRTUAL TABLE {fts} USING fts5(title, content='{table.name}', content_rowid='id')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table.name} BEGIN "
+        f"INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table.name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF title ON {table.name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, title) VALUES ('delete', old.id, old.title); "
+        f"INSERT INTO {fts}(rowid, title) VALUES (new.id, new.title); END",
+    ):
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(table, "before_drop", DDL(f"DROP TABLE IF EXISTS {fts}").execute_if(dialect="sqlite"))
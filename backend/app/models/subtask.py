@@ -4,10 +4,13 @@ from app.core.database import Base
 
 class SubTask(Base):
     __tablename__ = "subtasks"
+    # Never reuse ids that archived subtasks keep (see models/todo).
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     completed = Column(Boolean, default=False)
-    todo_id = Column(Integer, ForeignKey("todos.id"))
+    todo_id = Column(Integer, ForeignKey("todos.id"), index=True)
+    version = Column(Integer, default=0, nullable=False)
 
     todo = relationship("Todo", back_populates="subtasks")
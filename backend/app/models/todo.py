@@ -1,15 +1,54 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from datetime import datetime, timezone
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
+# Holds app.core.positions keys, which must compare bytewise: the "C"
+# collation on Postgres; SQLite compares bytes already.
+PositionKey = String().with_variant(String(collation="C"), "postgresql")
+
+def utcnow() -> datetime:
+    # Naive UTC, for timezone-less DateTime columns on every backend.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class Todo(Base):
     __tablename__ = "todos"
+    __table_args__ = (
+        Index("ix_todos_user_id_id", "user_id", "id"),
+        Index("ix_todos_user_id_version", "user_id", "version"),
+        Index(
+            "ix_todos_user_id_active", "user_id", "id",
+            postgresql_where=text("completed = false"), sqlite_where=text("completed = false"),
+        ),
+        # Each folder's todos (or the unfiled ones) in the user's order.
+        Index("ix_todos_user_id_folder_id_position", "user_id", "folder_id", "position"),
+        # Candidates for crud/archive, oldest first.
+        Index(
+            "ix_todos_archive_candidates", "updated_at",
+            postgresql_where=text("completed = true"), sqlite_where=text("completed = true"),
+        ),
+        # Archived todos keep their ids and may be restored, so SQLite must
+        # never hand a deleted (archived) id out again.
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     completed = Column(Boolean, default=False)
     user_id = Column(Integer, ForeignKey("users.id"))
-    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True, index=True)
+    # Owner's users.data_version at the time of the last write.
+    version = Column(Integer, default=0, nullable=False)
+    # Maintained by crud/subtask in the same transaction as each subtask
+    # write, so parent completion never needs the subtasks loaded.
+    total_subtasks = Column(Integer, default=0, nullable=False)
+    completed_subtasks = Column(Integer, default=0, nullable=False)
+    # Set on every insert and UPDATE (Core statements included); completed
+    # todos untouched for ARCHIVE_COMPLETED_AFTER_DAYS get archived.
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+    # Order within the todo's folder (or among unfiled todos); see
+    # app.core.positions. New todos go last, moves rewrite just this column.
+    position = Column(PositionKey, nullable=False)
 
     owner = relationship("User", back_populates="todos")
     folder = relationship("Folder", back_populates="todos")
@@ -10,6 +10,14 @@ class User(Base):
     full_name = Column(String, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    # Embedded in access tokens as the "ver" claim; tokens carrying another
+    # value are rejected. Nothing in the API bumps it. A bump made in the
+    # database reaches each worker once its cached user expires (see
+    # deps.user_cache), so old tokens keep working until then.
+    token_version = Column(Integer, default=0, nullable=False)
+    # Monotonic per-user counter bumped by every write to the user's todos,
+    # subtasks or folders; it doubles as the delta-sync token.
+    data_version = Column(Integer, default=0, nullable=False)
 
     todos = relationship("Todo", back_populates="owner")
     folders = relationship("Folder", back_populates="owner")
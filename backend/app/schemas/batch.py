@@ -0,0 +1,60 @@
+from typing import Annotated, List, Literal, Optional, Union
+from pydantic import BaseModel, Field, model_validator
+from app.schemas.subtask import SubTaskCreate, SubTaskUpdate
+from app.schemas.todo import TodoCreate, TodoUpdate
+
+class CreateTodoOp(BaseModel):
+    op: Literal["create_todo"]
+    todo: TodoCreate
+
+class UpdateTodoOp(BaseModel):
+    op: Literal["update_todo"]
+    id: int
+    todo: TodoUpdate
+
+class DeleteTodoOp(BaseModel):
+    op: Literal["delete_todo"]
+    id: int
+
+class CreateSubTaskOp(BaseModel):
+    op: Literal["create_subtask"]
+    # Either an existing todo, or the index of a create_todo operation
+    # earlier in the same batch.
+    todo_id: Optional[int] = None
+    todo_ref: Optional[int] = None
+    subtask: SubTaskCreate
+
+    @model_validator(mode="after")
+    def check_parent(self):
+        if (self.todo_id is None) == (self.todo_ref is None):
+            raise ValueError("Exactly one of todo_id or todo_ref is required")
+        return self
+
+class UpdateSubTaskOp(BaseModel):
+    op: Literal["update_subtask"]
+    todo_id: int
+    id: int
+    subtask: SubTaskUpdate
+
+class DeleteSubTaskOp(BaseModel):
+    op: Literal["delete_subtask"]
+    todo_id: int
+    id: int
+
+BatchOperation = Annotated[
+    Union[CreateTodoOp, UpdateTodoOp, DeleteTodoOp, CreateSubTaskOp, UpdateSubTaskOp, DeleteSubTaskOp],
+    Field(discriminator="op"),
+]
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(max_length=1000)
+
+class BatchResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
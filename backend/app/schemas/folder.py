@@ -8,10 +8,29 @@ class FolderBase(BaseModel):
 class FolderCreate(FolderBase):
     pass
 
-class Folder(FolderBase):
+class FolderOut(FolderBase):
     id: int
     user_id: int
+    version: int = 0
+
+    class Config:
+        from_attributes = True
+
+class Folder(FolderOut):
     todos: List[Todo] = []
 
     class Config:
         from_attributes = True
+
+class FolderCounts(BaseModel):
+    total_todos: int
+    completed_todos: int
+
+class FolderSummary(FolderCounts):
+    id: int
+    title: str
+
+class FolderSummaries(BaseModel):
+    folders: List[FolderSummary]
+    # Todos with no folder.
+    unfiled: FolderCounts
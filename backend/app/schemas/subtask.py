@@ -7,9 +7,13 @@ class SubTaskBase(BaseModel):
 class SubTaskCreate(SubTaskBase):
     pass
 
+class SubTaskUpdate(BaseModel):
+    completed: bool
+
 class SubTask(SubTaskBase):
     id: int
     todo_id: int
+    version: int = 0
 
     class Config:
         from_attributes = True
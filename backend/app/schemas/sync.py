@@ -0,0 +1,18 @@
+from typing import List
+from pydantic import BaseModel
+from app.schemas.folder import FolderOut
+from app.schemas.subtask import SubTask
+from app.schemas.todo import Todo
+
+class Deleted(BaseModel):
+    entity: str
+    id: int
+    version: int
+
+class Changes(BaseModel):
+    # Pass back as ?since= on the next poll.
+    version: int
+    todos: List[Todo] = []
+    subtasks: List[SubTask] = []
+    folders: List[FolderOut] = []
+    deleted: List[Deleted] = []
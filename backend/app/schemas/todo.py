@@ -1,10 +1,11 @@
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 class SubTaskOut(BaseModel):
     id: int
     title: str
     completed: bool
+    version: int = 0
     class Config:
         from_attributes = True
 
@@ -21,10 +22,28 @@ class TodoUpdate(BaseModel):
     completed: Optional[bool] = None
     folder_id: Optional[int] = None
 
+class TodoMove(BaseModel):
+    # The todo to follow, or to precede; with both, the gap between them.
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_anchor(self):
+        if self.after_id is None and self.before_id is None:
+            raise ValueError("At least one of after_id or before_id is required")
+        return self
+
 class Todo(TodoBase):
     id: int
     user_id: int
+    version: int = 0
+    total_subtasks: int = 0
+    completed_subtasks: int = 0
+    position: str = ""
     subtasks: List[SubTaskOut] = []
 
     class Config:
         from_attributes = True
+
+class TodoSearchResult(Todo):
+    rank: float
@@ -0,0 +1,35 @@
+from typing import Annotated, Literal, Optional, Union
+from pydantic import BaseModel, Field, TypeAdapter
+
+# One line of GET /todos/export and POST /todos/import. Ids are the
+# exporting account's; an import gives every folder, todo and subtask a new
+# id and maps the references in later lines onto them.
+
+class FolderRecord(BaseModel):
+    type: Literal["folder"]
+    id: int
+    title: str
+
+class TodoRecord(BaseModel):
+    type: Literal["todo"]
+    id: int
+    title: str
+    completed: bool = False
+    folder_id: Optional[int] = None
+    # Exported from the archive; imported todos are always active.
+    archived: bool = False
+
+class SubTaskRecord(BaseModel):
+    type: Literal["subtask"]
+    id: int
+    todo_id: int
+    title: str
+    completed: bool = False
+
+Record = Annotated[Union[FolderRecord, TodoRecord, SubTaskRecord], Field(discriminator="type")]
+record_adapter = TypeAdapter(Record)
+
+class ImportResult(BaseModel):
+    folders: int = 0
+    todos: int = 0
+    subtasks: int = 0
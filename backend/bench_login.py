@@ -0,0 +1,88 @@
+"""Micro-benchmark of login throughput against an in-process app.
+
+Runs against a throwaway SQLite database, so it needs no server:
+
+    python bench_login.py --requests 200 --concurrency 20 --rounds 10
+
+While the logins run, /health is polled to show whether password hashing
+stalls unrelated requests on the same event loop.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+EMAIL = "bench_login@example.com"
+PASSWORD = "password123"
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run_benchmark(total, concurrency):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resp = await client.post("/auth/signup", json={"email": EMAIL, "password": PASSWORD})
+        if resp.status_code != 200:
+            print(f"Signup failed: {resp.text}")
+            sys.exit(1)
+
+        latencies, statuses, health = [], {}, []
+        remaining = iter(range(total))
+        done = asyncio.Event()
+
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                resp = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+                latencies.append(time.perf_counter() - start)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                health.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+
+    print(f"Logins:      {total} in {elapsed:.2f}s ({total / elapsed:.1f}/s), concurrency {concurrency}")
+    print(f"Statuses:    {statuses}")
+    print(
+        f"Login ms:    p50 {percentile(latencies, 50) * 1000:.1f}"
+        f"  p95 {percentile(latencies, 95) * 1000:.1f}"
+        f"  p99 {percentile(latencies, 99) * 1000:.1f}"
+    )
+    print(
+        f"/health ms:  p50 {percentile(health, 50) * 1000:.1f}"
+        f"  max {max(health) * 1000:.1f}  (mean {statistics.mean(health) * 1000:.1f})"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, help="bcrypt cost; defaults to BCRYPT_ROUNDS")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["MIGRATE_ON_STARTUP"] = "true"
+    if args.rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    asyncio.run(run_benchmark(args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main()
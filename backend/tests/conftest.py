@@ -0,0 +1,37 @@
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Settings are read when app.core.config is first imported, so the test
+# environment has to be in place before any app module is.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ["MIGRATE_ON_STARTUP"] = "true"
+os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["ARCHIVE_INTERVAL_SECONDS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+def sign_up(client):
+    email = f"{uuid.uuid4().hex}@example.com"
+    client.post("/auth/signup", json={"email": email, "password": "password123"})
+    token = client.post("/auth/login", json={"email": email, "password": "password123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def auth_headers(client):
+    return sign_up(client)
+
+@pytest.fixture
+def other_auth_headers(client):
+    """A second user, for checking one user cannot reach another's data."""
+    return sign_up(client)
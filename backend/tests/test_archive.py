@@ -0,0 +1,149 @@
+"""Archiving completed todos, and restoring them when they are edited."""
+import pytest
+
+from app.crud.archive import archive_completed
+
+def archive(client, older_than_days=-1):
+    # A negative age puts the cutoff in the future, so every completed todo
+    # qualifies.
+    return client.portal.call(archive_completed, older_than_days, 1000)
+
+def create_todo(client, headers, title="Todo", subtasks=1):
+    todo = client.post("/todos/", json={"title": title}, headers=headers).json()
+    subtask_ids = [
+        client.post(f"/todos/{todo['id']}/subtasks", json={"title": f"Subtask {n}"}, headers=headers).json()["id"]
+        for n in range(subtasks)
+    ]
+    return todo["id"], subtask_ids
+
+def create_archived_todo(client, headers, subtasks=1):
+    todo_id, subtask_ids = create_todo(client, headers, title="Done", subtasks=subtasks)
+    client.put(f"/todos/{todo_id}", json={"completed": True}, headers=headers)
+    archive(client)
+    return todo_id, subtask_ids
+
+def active_ids(client, headers):
+    return {todo["id"] for todo in client.get("/todos/", headers=headers).json()}
+
+def archived_ids(client, headers):
+    return {todo["id"] for todo in client.get("/todos/archive", headers=headers).json()}
+
+def changes(client, headers, since):
+    return client.get("/todos/changes", params={"since": since}, headers=headers).json()
+
+def deleted_todo_ids(body):
+    return {row["id"] for row in body["deleted"] if row["entity"] == "todo"}
+
+def test_archiving_moves_completed_todos_with_their_subtasks(client, auth_headers):
+    done, _ = create_todo(client, auth_headers)
+    active, _ = create_todo(client, auth_headers)
+    client.put(f"/todos/{done}", json={"completed": True}, headers=auth_headers)
+    since = changes(client, auth_headers, 0)["version"]
+
+    assert archive(client) >= 1
+
+    assert active_ids(client, auth_headers) == {active}
+    (archived,) = client.get("/todos/archive", headers=auth_headers).json()
+    assert archived["id"] == done
+    assert len(archived["subtasks"]) == 1
+    # Sync clients see the archived todo as deleted.
+    body = changes(client, auth_headers, since)
+    assert body["version"] > since
+    assert deleted_todo_ids(body) == {done}
+
+def test_recently_completed_todos_stay_active(client, auth_headers):
+    todo_id, _ = create_todo(client, auth_headers)
+    client.put(f"/todos/{todo_id}", json={"completed": True}, headers=auth_headers)
+
+    archive(client, older_than_days=1)
+
+    assert active_ids(client, auth_headers) == {todo_id}
+    assert archived_ids(client, auth_headers) == set()
+
+def assert_restored(client, headers, todo_id, since):
+    assert todo_id in active_ids(client, headers)
+    assert todo_id not in archived_ids(client, headers)
+    body = changes(client, headers, since)
+    assert todo_id in {todo["id"] for todo in body["todos"]}
+    # The tombstone goes too, so a full download doesn't drop the todo.
+    assert todo_id not in deleted_todo_ids(changes(client, headers, 0))
+
+def test_updating_an_archived_todo_restores_it(client, auth_headers):
+    todo_id, subtask_ids = create_archived_todo(client, auth_headers)
+    since = changes(client, auth_headers, 0)["version"]
+
+    response = client.put(f"/todos/{todo_id}", json={"title": "Reopened", "completed": False}, headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["title"] == "Reopened"
+    assert [subtask["id"] for subtask in response.json()["subtasks"]] == subtask_ids
+    assert_restored(client, auth_headers, todo_id, since)
+
+def test_updating_a_subtask_of_an_archived_todo_restores_it(client, auth_headers):
+    todo_id, (subtask_id,) = create_archived_todo(client, auth_headers)
+    since = changes(client, auth_headers, 0)["version"]
+
+    response = client.put(f"/todos/{todo_id}/subtasks/{subtask_id}", json={"completed": True}, headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert_restored(client, auth_headers, todo_id, since)
+
+def test_moving_an_archived_todo_restores_it(client, auth_headers):
+    anchor, _ = create_todo(client, auth_headers)
+    todo_id, _ = create_archived_todo(client, auth_headers)
+    since = changes(client, auth_headers, 0)["version"]
+
+    response = client.patch(f"/todos/{todo_id}/move", json={"before_id": anchor}, headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert_restored(client, auth_headers, todo_id, since)
+
+@pytest.mark.parametrize("op", ["update_todo", "create_subtask", "update_subtask", "delete_subtask"])
+def test_batch_operations_on_an_archived_todo_restore_it(client, auth_headers, op):
+    todo_id, (subtask_id,) = create_archived_todo(client, auth_headers)
+    since = changes(client, auth_headers, 0)["version"]
+    operation = {
+        "update_todo": {"op": op, "id": todo_id, "todo": {"title": "Reopened"}},
+        "create_subtask": {"op": op, "todo_id": todo_id, "subtask": {"title": "More"}},
+        "update_subtask": {"op": op, "todo_id": todo_id, "id": subtask_id, "subtask": {"completed": True}},
+        "delete_subtask": {"op": op, "todo_id": todo_id, "id": subtask_id},
+    }[op]
+
+    response = client.post("/todos/batch", json={"operations": [operation]}, headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()["results"][0]["status"] == 200
+    assert_restored(client, auth_headers, todo_id, since)
+
+def test_deleting_an_archived_todo_removes_it(client, auth_headers):
+    todo_id, _ = create_archived_todo(client, auth_headers)
+
+    response = client.delete(f"/todos/{todo_id}", headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert todo_id not in active_ids(client, auth_headers)
+    assert todo_id not in archived_ids(client, auth_headers)
+    assert todo_id in deleted_todo_ids(changes(client, auth_headers, 0))
+
+def test_batch_delete_of_an_archived_todo_removes_it(client, auth_headers):
+    todo_id, _ = create_archived_todo(client, auth_headers)
+
+    response = client.post("/todos/batch", json={"operations": [{"op": "delete_todo", "id": todo_id}]}, headers=auth_headers)
+
+    assert response.json()["results"][0]["status"] == 200
+    assert todo_id not in active_ids(client, auth_headers)
+    assert todo_id not in archived_ids(client, auth_headers)
+
+def test_archived_ids_are_not_reused(client, auth_headers):
+    # The newest todo and subtask in the database, so a plain SQLite rowid
+    # would hand their ids out again.
+    todo_id, (subtask_id,) = create_archived_todo(client, auth_headers)
+
+    new_todo_id, (new_subtask_id,) = create_todo(client, auth_headers)
+
+    assert new_todo_id > todo_id
+    assert new_subtask_id > subtask_id
+    assert archived_ids(client, auth_headers) == {todo_id}
+    response = client.put(f"/todos/{todo_id}", json={"title": "Reopened"}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert active_ids(client, auth_headers) == {todo_id, new_todo_id}
@@ -0,0 +1,95 @@
+"""POST /todos/batch: mixed operations in one transaction, owned rows only."""
+import pytest
+
+from app.crud import batch as batch_crud
+
+def run_batch(client, headers, *operations):
+    response = client.post("/todos/batch", json={"operations": list(operations)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["results"]
+
+def todos(client, headers):
+    return {todo["id"]: todo for todo in client.get("/todos/", headers=headers).json()}
+
+def version(client, headers):
+    return client.get("/todos/changes", params={"since": 0}, headers=headers).json()["version"]
+
+def test_mixed_batch(client, auth_headers):
+    keep = client.post("/todos/", json={"title": "Keep"}, headers=auth_headers).json()
+    drop = client.post("/todos/", json={"title": "Drop"}, headers=auth_headers).json()
+    subtask = client.post(f"/todos/{keep['id']}/subtasks", json={"title": "Step"}, headers=auth_headers).json()
+    folder_id = client.post("/folders/", json={"title": "Folder"}, headers=auth_headers).json()["id"]
+
+    results = run_batch(
+        client, auth_headers,
+        {"op": "create_todo", "todo": {"title": "New", "folder_id": folder_id}},
+        {"op": "create_subtask", "todo_ref": 0, "subtask": {"title": "New step"}},
+        {"op": "update_todo", "id": keep["id"], "todo": {"title": "Kept"}},
+        {"op": "update_subtask", "todo_id": keep["id"], "id": subtask["id"], "subtask": {"completed": True}},
+        {"op": "delete_todo", "id": drop["id"]},
+    )
+
+    assert [result["status"] for result in results] == [200] * 5
+    after = todos(client, auth_headers)
+    assert set(after) == {keep["id"], results[0]["id"]}
+    new = after[results[0]["id"]]
+    assert new["folder_id"] == folder_id
+    assert [s["id"] for s in new["subtasks"]] == [results[1]["id"]]
+    assert after[keep["id"]]["title"] == "Kept"
+    # Its only subtask is done, so the todo is too.
+    assert after[keep["id"]]["completed"] is True
+    assert after[keep["id"]]["subtasks"][0]["completed"] is True
+
+def test_failed_statement_rolls_back_whole_batch(client, auth_headers, monkeypatch):
+    todo = client.post("/todos/", json={"title": "Before"}, headers=auth_headers).json()
+    before = version(client, auth_headers)
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("counter refresh failed")
+
+    monkeypatch.setattr(batch_crud, "refresh_subtask_counters", fail)
+    with pytest.raises(RuntimeError):
+        client.post("/todos/batch", json={"operations": [
+            {"op": "create_todo", "todo": {"title": "New"}},
+            {"op": "update_todo", "id": todo["id"], "todo": {"title": "After"}},
+        ]}, headers=auth_headers)
+
+    after = todos(client, auth_headers)
+    assert set(after) == {todo["id"]}
+    assert after[todo["id"]]["title"] == "Before"
+    assert version(client, auth_headers) == before
+
+def test_foreign_todos_and_subtasks_are_rejected(client, auth_headers, other_auth_headers):
+    theirs = client.post("/todos/", json={"title": "Theirs"}, headers=other_auth_headers).json()
+    subtask = client.post(f"/todos/{theirs['id']}/subtasks", json={"title": "Step"}, headers=other_auth_headers).json()
+
+    results = run_batch(
+        client, auth_headers,
+        {"op": "update_todo", "id": theirs["id"], "todo": {"title": "Mine now"}},
+        {"op": "delete_todo", "id": theirs["id"]},
+        {"op": "create_subtask", "todo_id": theirs["id"], "subtask": {"title": "Extra"}},
+        {"op": "update_subtask", "todo_id": theirs["id"], "id": subtask["id"], "subtask": {"completed": True}},
+        {"op": "delete_subtask", "todo_id": theirs["id"], "id": subtask["id"]},
+        {"op": "create_todo", "todo": {"title": "Mine"}},
+    )
+
+    assert [result["status"] for result in results] == [404] * 5 + [200]
+    unchanged = todos(client, other_auth_headers)[theirs["id"]]
+    assert unchanged["title"] == "Theirs"
+    assert [(s["id"], s["completed"]) for s in unchanged["subtasks"]] == [(subtask["id"], False)]
+
+def test_foreign_folders_are_rejected(client, auth_headers, other_auth_headers):
+    folder_id = client.post("/folders/", json={"title": "Theirs"}, headers=other_auth_headers).json()["id"]
+    todo = client.post("/todos/", json={"title": "Mine"}, headers=auth_headers).json()
+
+    results = run_batch(
+        client, auth_headers,
+        {"op": "create_todo", "todo": {"title": "Filed", "folder_id": folder_id}},
+        {"op": "create_subtask", "todo_ref": 0, "subtask": {"title": "Step"}},
+        {"op": "update_todo", "id": todo["id"], "todo": {"folder_id": folder_id}},
+    )
+
+    assert [result["status"] for result in results] == [404, 404, 404]
+    assert results[0]["detail"] == "Folder not found"
+    assert todos(client, auth_headers) == {todo["id"]: todo}
+    assert client.get("/folders/", headers=other_auth_headers).json()[0]["todos"] == []
@@ -0,0 +1,69 @@
+"""Response cache for list endpoints, on the memory and Redis backends."""
+import pytest
+
+from app.core.cache import FakeRedis, MemoryCacheBackend, RedisCacheBackend, response_cache
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def cache_backend(request, monkeypatch):
+    # The test environment disables the cache; swap a backend into the
+    # module-level cache the endpoints and the commit hook both use.
+    if request.param == "memory":
+        backend = MemoryCacheBackend(max_bytes=1024 * 1024)
+    else:
+        backend = RedisCacheBackend(FakeRedis(), ttl_seconds=60)
+    monkeypatch.setattr(response_cache, "backend", backend)
+    return backend
+
+def get(client, headers, path):
+    hits, misses = response_cache.hits, response_cache.misses
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return response, response_cache.hits - hits, response_cache.misses - misses
+
+def user_id(client, headers):
+    return client.get("/auth/me", headers=headers).json()["id"]
+
+@pytest.mark.parametrize("path", ["/todos/", "/folders/"])
+def test_unchanged_version_is_served_from_cache(client, auth_headers, cache_backend, path):
+    client.post("/folders/", json={"title": "Folder"}, headers=auth_headers)
+    client.post("/todos/", json={"title": "Todo"}, headers=auth_headers)
+
+    first, hits, misses = get(client, auth_headers, path)
+    assert (hits, misses) == (0, 1)
+    second, hits, misses = get(client, auth_headers, path)
+    assert (hits, misses) == (1, 0)
+
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-type"] == first.headers["content-type"]
+
+def test_write_misses_and_drops_old_entries(client, auth_headers, cache_backend):
+    client.post("/todos/", json={"title": "First"}, headers=auth_headers)
+    before, _, _ = get(client, auth_headers, "/todos/")
+
+    client.post("/todos/", json={"title": "Second"}, headers=auth_headers)
+    after, hits, misses = get(client, auth_headers, "/todos/")
+
+    assert (hits, misses) == (0, 1)
+    assert [todo["title"] for todo in after.json()] == ["First", "Second"]
+    assert after.headers["etag"] != before.headers["etag"]
+    stale = client.portal.call(cache_backend.get, user_id(client, auth_headers), before.headers["etag"])
+    assert stale is None
+
+def test_entries_are_per_user(client, auth_headers, other_auth_headers, cache_backend):
+    client.post("/todos/", json={"title": "Mine"}, headers=auth_headers)
+    client.post("/todos/", json={"title": "Theirs"}, headers=other_auth_headers)
+    get(client, auth_headers, "/todos/")
+    theirs, _, _ = get(client, other_auth_headers, "/todos/")
+
+    # Each user only ever gets their own list back.
+    mine, hits, _ = get(client, auth_headers, "/todos/")
+    assert hits == 1
+    assert [todo["title"] for todo in mine.json()] == ["Mine"]
+
+    # A write by one user leaves the other's entries in place.
+    client.post("/todos/", json={"title": "Mine too"}, headers=auth_headers)
+    again, hits, misses = get(client, other_auth_headers, "/todos/")
+    assert (hits, misses) == (1, 0)
+    assert again.content == theirs.content
+    assert [todo["title"] for todo in again.json()] == ["Theirs"]
@@ -0,0 +1,82 @@
+"""Idempotency-Key replays, conflicts and expiry, on both store backends."""
+import time
+
+import pytest
+
+from app.core import idempotency
+from app.core.cache import FakeRedis
+from app.core.config import settings
+
+TTL_SECONDS = 60
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def store(request, monkeypatch):
+    if request.param == "memory":
+        store = idempotency.MemoryIdempotencyStore(max_bytes=1024 * 1024, ttl_seconds=TTL_SECONDS)
+    else:
+        store = idempotency.RedisIdempotencyStore(FakeRedis(), ttl_seconds=TTL_SECONDS)
+    monkeypatch.setattr(idempotency, "idempotency_store", store)
+    return store
+
+def post_todo(client, headers, key, title="Write report"):
+    return client.post("/todos/", json={"title": title}, headers={**headers, "Idempotency-Key": key})
+
+def todo_count(client, headers):
+    return len(client.get("/todos/", headers=headers).json())
+
+def test_same_key_replays_stored_response(client, auth_headers, store):
+    first = post_todo(client, auth_headers, "key-1")
+    second = post_todo(client, auth_headers, "key-1")
+
+    assert first.status_code == second.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.content == first.content
+    assert todo_count(client, auth_headers) == 1
+
+def test_same_key_with_different_body_is_rejected(client, auth_headers, store):
+    post_todo(client, auth_headers, "key-1")
+    response = post_todo(client, auth_headers, "key-1", title="Something else")
+
+    assert response.status_code == 422
+    assert todo_count(client, auth_headers) == 1
+
+def test_in_flight_duplicate_gets_conflict(client, auth_headers, store, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    # Hold the key as a request still running with it would.
+    key = idempotency._key(auth_headers["Authorization"].encode(), b"key-1")
+    assert client.portal.call(store.begin, key)
+
+    assert post_todo(client, auth_headers, "key-1").status_code == 409
+
+    client.portal.call(store.finish, key, None)
+    response = post_todo(client, auth_headers, "key-1")
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+
+def test_stored_response_expires_after_ttl(client, auth_headers, store, monkeypatch):
+    post_todo(client, auth_headers, "key-1")
+
+    monotonic = time.monotonic
+    monkeypatch.setattr(time, "monotonic", lambda: monotonic() + TTL_SECONDS + 1)
+    response = post_todo(client, auth_headers, "key-1")
+
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert todo_count(client, auth_headers) == 2
+
+def test_oversized_body_is_rejected(client, auth_headers, store, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_MAX_BODY_BYTES", 16)
+
+    assert post_todo(client, auth_headers, "key-1", title="A title too long to buffer").status_code == 413
+    assert todo_count(client, auth_headers) == 0
+
+def test_streaming_import_ignores_key(client, auth_headers, store):
+    line = b'{"type": "todo", "id": 1, "title": "Imported"}\n'
+    headers = {**auth_headers, "Idempotency-Key": "key-1", "Content-Type": "application/x-ndjson"}
+    for _ in range(2):
+        response = client.post("/todos/import", content=line, headers=headers)
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+
+    assert todo_count(client, auth_headers) == 2
@@ -0,0 +1,155 @@
+"""Fractional position keys and PATCH /todos/{id}/move."""
+import pytest
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.positions import key_between, keys_after
+from app.crud.archive import archive_completed
+from app.models.todo import Todo
+
+@pytest.mark.parametrize("lower, upper", [
+    (None, None),
+    (None, "a0"),
+    ("a0", None),
+    ("a0", "a1"),  # adjacent integers
+    ("Zz", "a0"),  # adjacent across the sign of the integer part
+    ("a0", "a0V"),  # one key a prefix of the other
+    ("a0V", "a0W"),  # adjacent fractions after a common prefix
+    ("a0VzzV", "a0W"),
+    ("b00", "b001"),
+])
+def test_key_between_sorts_between_its_bounds(lower, upper):
+    key = key_between(lower, upper)
+
+    assert lower is None or lower < key
+    assert upper is None or key < upper
+    assert not key.endswith("0") or key == "a0"
+
+def test_key_between_keeps_order_when_inserting_at_one_spot():
+    lower, upper = "a0", "a1"
+    for _ in range(100):
+        key = key_between(lower, upper)
+        assert lower < key < upper
+        upper = key
+
+@pytest.mark.parametrize("lower, upper", [("a1", "a0"), ("a0", "a0"), ("a0V", "a0")])
+def test_key_between_rejects_bounds_out_of_order(lower, upper):
+    with pytest.raises(ValueError):
+        key_between(lower, upper)
+
+def test_keys_after_ascends():
+    keys = [key for key, _ in zip(keys_after(None), range(200))]
+
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+def create_todos(client, headers, count, folder_id=None):
+    return [
+        client.post("/todos/", json={"title": f"Todo {n}", "folder_id": folder_id}, headers=headers).json()["id"]
+        for n in range(count)
+    ]
+
+def order(client, headers, folder_id=None):
+    todos = [todo for todo in client.get("/todos/", headers=headers).json() if todo["folder_id"] == folder_id]
+    return [todo["id"] for todo in sorted(todos, key=lambda todo: (todo["position"], todo["id"]))]
+
+def positions(client, headers):
+    return {todo["id"]: todo["position"] for todo in client.get("/todos/", headers=headers).json()}
+
+def move(client, headers, todo_id, after_id=None, before_id=None):
+    return client.patch(f"/todos/{todo_id}/move", json={"after_id": after_id, "before_id": before_id}, headers=headers)
+
+def set_positions(client, positions):
+    async def write():
+        async with AsyncSessionLocal() as db:
+            for todo_id, position in positions.items():
+                await db.execute(update(Todo).where(Todo.id == todo_id).values(position=position))
+            await db.commit()
+    client.portal.call(write)
+
+def test_new_todos_append_in_order(client, auth_headers):
+    ids = create_todos(client, auth_headers, 5)
+
+    assert order(client, auth_headers) == ids
+
+def test_move_between_neighbours_writes_only_the_moved_todo(client, auth_headers):
+    a, b, c, d = create_todos(client, auth_headers, 4)
+    before = positions(client, auth_headers)
+
+    response = move(client, auth_headers, d, after_id=a, before_id=b)
+
+    assert response.status_code == 200, response.text
+    assert order(client, auth_headers) == [a, d, b, c]
+    after = positions(client, auth_headers)
+    assert {todo_id for todo_id in before if before[todo_id] != after[todo_id]} == {d}
+
+def test_move_to_either_end(client, auth_headers):
+    a, b, c = create_todos(client, auth_headers, 3)
+
+    assert move(client, auth_headers, a, after_id=c).status_code == 200
+    assert move(client, auth_headers, c, before_id=b).status_code == 200
+
+    assert order(client, auth_headers) == [c, b, a]
+
+def test_move_joins_the_anchor_folder(client, auth_headers):
+    folder_id = client.post("/folders/", json={"title": "Folder"}, headers=auth_headers).json()["id"]
+    a, b = create_todos(client, auth_headers, 2, folder_id=folder_id)
+    (c,) = create_todos(client, auth_headers, 1)
+
+    response = move(client, auth_headers, c, after_id=a)
+
+    assert response.json()["folder_id"] == folder_id
+    assert order(client, auth_headers, folder_id) == [a, c, b]
+
+def test_move_next_to_itself_is_rejected(client, auth_headers):
+    (a,) = create_todos(client, auth_headers, 1)
+
+    assert move(client, auth_headers, a, after_id=a).status_code == 400
+
+def test_move_of_missing_todo_is_not_found(client, auth_headers):
+    (a,) = create_todos(client, auth_headers, 1)
+
+    assert move(client, auth_headers, 10**9, after_id=a).status_code == 404
+
+def test_move_between_todos_in_different_folders_conflicts(client, auth_headers):
+    folder_id = client.post("/folders/", json={"title": "Folder"}, headers=auth_headers).json()["id"]
+    a, b = create_todos(client, auth_headers, 2)
+    (c,) = create_todos(client, auth_headers, 1, folder_id=folder_id)
+
+    response = move(client, auth_headers, b, after_id=a, before_id=c)
+
+    assert response.status_code == 409
+    assert order(client, auth_headers) == [a, b]
+
+def test_move_next_to_archived_todo_conflicts(client, auth_headers):
+    a, b, c = create_todos(client, auth_headers, 3)
+    client.put(f"/todos/{b}", json={"completed": True}, headers=auth_headers)
+    client.portal.call(archive_completed, -1, 1000)
+
+    assert move(client, auth_headers, c, after_id=b).status_code == 409
+    assert move(client, auth_headers, c, after_id=a, before_id=b).status_code == 409
+    assert order(client, auth_headers) == [a, c]
+
+def test_move_between_equal_keys_rebalances_the_folder(client, auth_headers):
+    a, b, c = create_todos(client, auth_headers, 3)
+    set_positions(client, {a: "a5", b: "a5"})
+
+    response = move(client, auth_headers, c, after_id=a, before_id=b)
+
+    assert response.status_code == 200, response.text
+    assert order(client, auth_headers) == [a, c, b]
+    keys = positions(client, auth_headers)
+    assert len(set(keys.values())) == 3
+
+def test_long_keys_are_rebalanced_in_the_background(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "POSITION_REBALANCE_LENGTH", 4)
+    a, b, c = create_todos(client, auth_headers, 3)
+    set_positions(client, {a: "a0VVVV", b: "a0VVVVV"})
+
+    response = move(client, auth_headers, c, after_id=a, before_id=b)
+
+    # The response carries the long key; the rebalance runs after it.
+    assert len(response.json()["position"]) > settings.POSITION_REBALANCE_LENGTH
+    assert order(client, auth_headers) == [a, c, b]
+    assert max(len(key) for key in positions(client, auth_headers).values()) <= settings.POSITION_REBALANCE_LENGTH
@@ -0,0 +1,49 @@
+"""List endpoints run a fixed number of statements however many rows they return."""
+import pytest
+from sqlalchemy import event
+
+from app.core.database import async_engine
+
+# users.data_version, then the rows, then one batched load per relationship.
+LIST_QUERY_COUNTS = {
+    "/todos/": 3,  # version, todos, subtasks
+    "/folders/": 4,  # version, folders, todos, subtasks
+}
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+def seed(client, headers, folders, todos_per_folder, subtasks_per_todo):
+    for f in range(folders):
+        folder = client.post("/folders/", json={"title": f"Folder {f}"}, headers=headers).json()
+        for t in range(todos_per_folder):
+            todo = client.post("/todos/", json={"title": f"Todo {t}", "folder_id": folder["id"]}, headers=headers).json()
+            for s in range(subtasks_per_todo):
+                client.post(f"/todos/{todo['id']}/subtasks", json={"title": f"Subtask {s}"}, headers=headers)
+
+def count_statements(client, headers, statements, path):
+    # Warm up first, so only the steady-state request is counted.
+    client.get(path, headers=headers)
+    statements.clear()
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+@pytest.mark.parametrize("path", sorted(LIST_QUERY_COUNTS))
+def test_list_query_count_is_fixed(client, auth_headers, statements, path):
+    seed(client, auth_headers, folders=1, todos_per_folder=1, subtasks_per_todo=1)
+    small, _ = count_statements(client, auth_headers, statements, path)
+
+    seed(client, auth_headers, folders=3, todos_per_folder=4, subtasks_per_todo=3)
+    large, body = count_statements(client, auth_headers, statements, path)
+
+    assert len(body) > 1
+    assert small == large == LIST_QUERY_COUNTS[path]
@@ -0,0 +1,96 @@
+"""Read routing between the primary and a read replica.
+
+The replica is a copy of the primary SQLite file taken mid-test, so it
+lags by every write made after the copy, and a row edited in the copy
+alone shows which database a read was served from.
+"""
+import shutil
+import sqlite3
+import uuid
+
+import pytest
+
+from app.core.database import ReplicaSet, engine, replicas
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="the replica is a copy of the SQLite file")
+
+REPLICA_TITLE = "Seen on the replica"
+
+@pytest.fixture
+def use_replica(client, monkeypatch):
+    """Point the app's ReplicaSet at one replica URL for the test."""
+    attached = []
+
+    def attach(url):
+        replica_set = ReplicaSet([url], sticky_seconds=60, retry_seconds=60)
+        for name, value in vars(replica_set).items():
+            monkeypatch.setattr(replicas, name, value)
+        attached.append(replica_set)
+
+    yield attach
+    for replica_set in attached:
+        client.portal.call(replica_set.dispose)
+
+def snapshot(tmp_path, todo_id):
+    """Copy the primary into a replica file, marking todo_id's title in the copy."""
+    path = tmp_path / "replica.db"
+    shutil.copy(engine.url.database, path)
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE todos SET title = ? WHERE id = ?", (REPLICA_TITLE, todo_id))
+    return f"sqlite:///{path}"
+
+def titles(client, headers):
+    response = client.get("/todos/", headers=headers)
+    assert response.status_code == 200, response.text
+    return [todo["title"] for todo in response.json()]
+
+def test_reads_go_to_the_replica(client, auth_headers, use_replica, tmp_path):
+    todo = client.post("/todos/", json={"title": "On the primary"}, headers=auth_headers).json()
+    use_replica(snapshot(tmp_path, todo["id"]))
+
+    assert titles(client, auth_headers) == [REPLICA_TITLE]
+    assert client.get("/auth/me", headers=auth_headers).status_code == 200
+    changes = client.get("/todos/changes", params={"since": 0}, headers=auth_headers).json()
+    assert [todo["title"] for todo in changes["todos"]] == [REPLICA_TITLE]
+    # The replica's search tables follow its copy of the row.
+    found = client.get("/todos/search", params={"q": "replica"}, headers=auth_headers).json()
+    assert [todo["title"] for todo in found] == [REPLICA_TITLE]
+    assert replicas.replica_reads == 4
+
+def test_writer_reads_from_the_primary(client, auth_headers, other_auth_headers, use_replica, tmp_path):
+    todo = client.post("/todos/", json={"title": "On the primary"}, headers=auth_headers).json()
+    theirs = client.post("/todos/", json={"title": "Theirs"}, headers=other_auth_headers).json()
+    use_replica(snapshot(tmp_path, theirs["id"]))
+    assert titles(client, auth_headers) == ["On the primary"]
+
+    client.put(f"/todos/{todo['id']}", json={"title": "Edited"}, headers=auth_headers)
+
+    # The replica never sees the edit; the writer reads it from the primary.
+    assert titles(client, auth_headers) == ["Edited"]
+    assert replicas.sticky_reads == 1
+    # Users who did not write still read from the replica.
+    assert titles(client, other_auth_headers) == [REPLICA_TITLE]
+
+def test_user_missing_from_lagging_replica_is_found_on_the_primary(client, auth_headers, use_replica, tmp_path):
+    todo = client.post("/todos/", json={"title": "On the primary"}, headers=auth_headers).json()
+    use_replica(snapshot(tmp_path, todo["id"]))
+    email = f"{uuid.uuid4().hex}@example.com"
+    client.post("/auth/signup", json={"email": email, "password": "password123"})
+    token = client.post("/auth/login", json={"email": email, "password": "password123"}).json()["access_token"]
+
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == email
+
+def test_unavailable_replica_falls_back_to_the_primary(client, auth_headers, use_replica, tmp_path):
+    client.post("/todos/", json={"title": "On the primary"}, headers=auth_headers)
+    use_replica(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+
+    assert titles(client, auth_headers) == ["On the primary"]
+    assert replicas.healthy == 0
+    assert replicas.fallback_reads == 1
+    # Out of rotation until READ_REPLICA_RETRY_SECONDS pass, so later reads
+    # go straight to the primary.
+    assert titles(client, auth_headers) == ["On the primary"]
+    assert replicas.fallback_reads == 2
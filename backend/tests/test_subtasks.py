@@ -0,0 +1,91 @@
+"""Subtask counters and the parent todo's completion."""
+from app.core.database import AsyncSessionLocal
+from app.crud import subtask as subtask_crud
+
+def create_todo(client, headers, *completed):
+    todo_id = client.post("/todos/", json={"title": "Parent"}, headers=headers).json()["id"]
+    subtask_ids = [
+        client.post(f"/todos/{todo_id}/subtasks", json={"title": f"Step {n}", "completed": done}, headers=headers).json()["id"]
+        for n, done in enumerate(completed)
+    ]
+    return todo_id, subtask_ids
+
+def get_todo(client, headers, todo_id):
+    return next(todo for todo in client.get("/todos/", headers=headers).json() if todo["id"] == todo_id)
+
+def set_subtask(client, headers, todo_id, subtask_id, completed):
+    response = client.put(f"/todos/{todo_id}/subtasks/{subtask_id}", json={"completed": completed}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def version(client, headers):
+    return client.get("/todos/changes", params={"since": 0}, headers=headers).json()["version"]
+
+def delete_subtask(client, headers, subtask_id):
+    user_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    async def delete():
+        async with AsyncSessionLocal() as db:
+            deleted = await subtask_crud.delete_subtask(db, subtask_id=subtask_id, user_id=user_id)
+            await db.commit()
+            return deleted
+    return client.portal.call(delete)
+
+def test_completing_every_subtask_completes_the_parent(client, auth_headers):
+    todo_id, (first, second) = create_todo(client, auth_headers, False, False)
+
+    set_subtask(client, auth_headers, todo_id, first, True)
+    assert get_todo(client, auth_headers, todo_id)["completed"] is False
+    set_subtask(client, auth_headers, todo_id, second, True)
+    assert get_todo(client, auth_headers, todo_id)["completed"] is True
+
+    set_subtask(client, auth_headers, todo_id, first, False)
+    assert get_todo(client, auth_headers, todo_id)["completed"] is False
+
+def test_unchanged_subtask_still_syncs_the_parent(client, auth_headers):
+    todo_id, (subtask_id,) = create_todo(client, auth_headers, True)
+    client.put(f"/todos/{todo_id}", json={"completed": False}, headers=auth_headers)
+
+    subtask = set_subtask(client, auth_headers, todo_id, subtask_id, True)
+
+    assert subtask["completed"] is True
+    assert get_todo(client, auth_headers, todo_id)["completed"] is True
+
+def test_unchanged_subtask_and_parent_write_nothing(client, auth_headers):
+    todo_id, (subtask_id,) = create_todo(client, auth_headers, False)
+    set_subtask(client, auth_headers, todo_id, subtask_id, True)
+    before = version(client, auth_headers)
+
+    set_subtask(client, auth_headers, todo_id, subtask_id, True)
+
+    assert version(client, auth_headers) == before
+
+def test_deleting_the_last_open_subtask_completes_the_parent(client, auth_headers):
+    todo_id, (done, open_) = create_todo(client, auth_headers, True, False)
+
+    assert delete_subtask(client, auth_headers, open_) is not None
+
+    todo = get_todo(client, auth_headers, todo_id)
+    assert todo["completed"] is True
+    assert [subtask["id"] for subtask in todo["subtasks"]] == [done]
+
+def test_deleting_every_subtask_leaves_the_parent_as_it_was(client, auth_headers):
+    todo_id, (subtask_id,) = create_todo(client, auth_headers, False)
+
+    delete_subtask(client, auth_headers, subtask_id)
+
+    todo = get_todo(client, auth_headers, todo_id)
+    assert todo["completed"] is False
+    assert todo["subtasks"] == []
+
+def test_batch_subtask_delete_completes_the_parent(client, auth_headers):
+    todo_id, (_, open_) = create_todo(client, auth_headers, True, False)
+
+    response = client.post(
+        "/todos/batch",
+        json={"operations": [{"op": "delete_subtask", "todo_id": todo_id, "id": open_}]},
+        headers=auth_headers,
+    )
+
+    assert response.json()["results"][0]["status"] == 200
+    assert get_todo(client, auth_headers, todo_id)["completed"] is True